@@ -1,34 +1,33 @@
-import sqlite3
 from datetime import datetime, timedelta
-import sqlite3
 from pathlib import Path
-from db import get_connection, list_applications_df
+import os
+from db import get_connection, cached, day_number, status_code, role_ngrams, \
+    STATUSES, DEFAULT_USER, MAX_ROLE_NGRAM
+from profiling import timed
 import pandas as pd
-import streamlit as st
 from collections import Counter
-import re
-from sklearn.feature_extraction.text import CountVectorizer
+import json
 import numpy as np
 
 DB_PATH = Path(__file__).parent / "job_apps.db"
 
-STOPWORDS = {
-    "intern","summer","fall","spring","2024","2025","ii","iii","sr","jr",
-    "the","and","of","for","with","to","a","an","at","—","-","|","(",")"
-}
-
-try:
-    from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
-except Exception:
-    CountVectorizer = None
-    TfidfVectorizer = None
+# where weekly_applications, calendar_counts, top_companies and top_role_terms read from when
+# given no frame: "db" (the counter tables) or "snapshot" (snapshot.py's Arrow copy of applications)
+SOURCES = ("db", "snapshot")
+DEFAULT_SOURCE = os.environ.get("JOBTRACKER_ANALYTICS_SOURCE", "db")
 
 
 # Datetime helpers
+def _as_dates(s):
+    # frames from db.py already hold datetime64, only parse when given strings
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    return pd.to_datetime(s, errors='coerce')
+
 def _normalize_dates(s):
-    # s is a string of dates
+    # s is a series of dates (datetime64 or strings)
     # returns pandas datetime with no time
-    return pd.to_datetime(s, errors='coerce').dt.normalize()
+    return _as_dates(s).dt.normalize()
 
 def _window_bounds(n_days: int, end=None):
     # end defaults to "today" at midnight
@@ -53,6 +52,7 @@ def _anchor_week_start(ts: pd.Timestamp, week_start="MON"):
     
     raise ValueError("week start must be MON or SUN")
 
+@timed
 def last_seven_days():
     now = datetime.now()
     dates = []
@@ -64,30 +64,107 @@ def last_seven_days():
     return dates
     
 
-def count_apps_this_week():
+@timed
+def count_apps_this_week(user_id=DEFAULT_USER):
+    return summary(user_id)["past_7_days"]
+
+
+@timed
+def summary(user_id=DEFAULT_USER):
+    """
+    All the Analytics header numbers for one user from one query over the stats and daily_rollup tables.
+    Returns {'total', 'past_7_days', 'Applied', 'OA', 'Interview', 'Offer', 'Rejected'}
+    """
     days = last_seven_days()
-    end = days[0]
-    start = days[-1]
+    return _summary(days[-1], days[0], user_id)
+
+
+@cached
+def _summary(start, end, user_id=DEFAULT_USER):
 
     sql = """
-        SELECT COUNT(*) FROM applications
-        WHERE date_applied >= ? AND date_applied <= ?;
+        SELECT scope, key, n FROM stats WHERE user_id = ?
+        UNION ALL
+        SELECT 'day', '', COALESCE(SUM(n), 0) FROM daily_rollup
+        WHERE user_id = ? AND day >= ? AND day <= ?;
         """
 
+    out = {"total": 0, "past_7_days": 0, "Applied": 0, "OA": 0, "Interview": 0, "Offer": 0, "Rejected": 0}
+
     with get_connection() as conn:
-        num = conn.execute(sql, (start, end)).fetchone()
-        return num[0]
+        rows = conn.execute(sql, (user_id, user_id, start, end)).fetchall()
+
+    for scope, key, n in rows:
+        if scope == "total":
+            out["total"] = n
+        elif scope == "status":
+            out[key] = n
+        else:
+            out["past_7_days"] += n
 
+    return out
 
-def weekly_applications(df: pd.DataFrame, window: int=4):
-    out = df[['date_applied']].copy()
-    out['date_applied'] = pd.to_datetime(out['date_applied'], errors='coerce')
-    out = out.dropna(subset=['date_applied'])
 
-    out = out.set_index('date_applied').sort_index()
+def _iso_day(d):
+    return pd.Timestamp(d).strftime("%Y-%m-%d")
+
+@cached
+@timed
+def daily_counts(date_start=None, date_end=None, status=None, user_id=DEFAULT_USER) -> pd.DataFrame:
+    """
+    Applications per day and status from daily_rollup: ['day', 'status', 'n'], day as datetime64.
+    Costs one row per (day, status) in range, however many applications there are.
+    """
+    sql = "SELECT day, status, n FROM daily_rollup WHERE user_id = ? AND n > 0"
+    params = [user_id]
 
+    if date_start is not None:
+        sql += " AND day >= ?"; params.append(_iso_day(date_start))
+    if date_end is not None:
+        sql += " AND day <= ?"; params.append(_iso_day(date_end))
+    if status:
+        sql += " AND status = ?"; params.append(status)
 
-    weekly = out.resample('W-SUN').size().rename('apps').to_frame()
+    with get_connection() as conn:
+        rows = conn.execute(sql + " ORDER BY day", params).fetchall()
+
+    return pd.DataFrame({
+        "day": pd.to_datetime(pd.Index([r[0] for r in rows], dtype=object), format="ISO8601", errors="coerce").as_unit("ns"),
+        "status": pd.Categorical([r[1] for r in rows], categories=STATUSES),
+        "n": np.array([r[2] for r in rows], dtype=np.int64),
+    })
+
+def _per_day(daily: pd.DataFrame):
+    # daily_counts() -> Series of applications per day
+    return daily.dropna(subset=["day"]).groupby("day")["n"].sum()
+
+def _snapshot():
+    # snapshot.py needs pyarrow, the db source doesn't: only import it once it is asked for
+    import snapshot
+    return snapshot
+
+def _snapshot_table(source, user_id):
+    # the user's rows from the Arrow snapshot, None when source says to use the database
+    source = source or DEFAULT_SOURCE
+    if source not in SOURCES:
+        raise ValueError(f"source must be one of {SOURCES}")
+    if source == "db":
+        return None
+    return _snapshot().applications_table(user_id)
+
+@cached
+@timed
+def weekly_applications(df: pd.DataFrame = None, window: int=4, user_id=DEFAULT_USER, source=None):
+    # without a frame, count from daily_rollup (or the snapshot) instead of the raw rows
+    table = _snapshot_table(source, user_id) if df is None else None
+    if table is not None:
+        per_day = _snapshot().per_day(table)
+    else:
+        per_day = chart_frames(df, user_id=user_id)["per_day"].set_index("day")["n"]
+    per_day.index = pd.DatetimeIndex(per_day.index)
+
+
+    weekly = per_day.resample('W-SUN').sum().rename('apps').to_frame()
     
     weekly.index = weekly.index - pd.Timedelta(days=6)
     weekly.index.name = 'week_start'
@@ -96,87 +173,318 @@ def weekly_applications(df: pd.DataFrame, window: int=4):
 
     weekly['apps_ma'] = weekly['apps'].rolling(window=window, min_periods=1).mean()
 
-    return weekly.reset_index().rename(columns={'date_applied': 'week_start'})
+    return weekly.reset_index()
 
 
-def get_status_count(status: str):
+@cached
+@timed
+def get_status_count(status: str, user_id=DEFAULT_USER):
     if status not in {'Applied', 'OA', 'Interview', 'Offer', 'Rejected'}:
         print("Status not available")
         return
     
     sql = """
-        SELECT COUNT(*) FROM applications
-        WHERE status = ?
+        SELECT COALESCE(SUM(n), 0) FROM stats
+        WHERE user_id = ? AND scope = 'status' AND key = ?
         """
 
     with get_connection() as conn:
-        num = conn.execute(sql, (status, )).fetchone()
+        num = conn.execute(sql, (user_id, status)).fetchone()
         return num[0]
 
-def apps_per_day(df: pd.DataFrame) -> pd.DataFrame:
+# default order of pipeline_funnel, statuses outside it (Rejected) only count as applied
+FUNNEL_ORDER = ["Applied", "OA", "Interview", "Offer"]
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+def _daily_from_df(df: pd.DataFrame) -> pd.DataFrame:
+    # raw rows -> the daily_counts() shape with one group-by
+    daily = pd.DataFrame({
+        "day": _as_dates(df["date_applied"]).dt.normalize(),
+        "status": pd.Categorical(df["status"], categories=STATUSES),
+    })
+    return daily.groupby(["day", "status"], observed=True).size().rename("n").reset_index()
+
+def _funnel(status_n: pd.Series, order) -> pd.DataFrame:
+    # an application sitting at a stage has been through every stage before it
+    reached = status_n.reindex(order, fill_value=0)[::-1].cumsum()[::-1]
+    reached.iloc[0] = status_n.sum()
+    return pd.DataFrame({"stage": list(order), "n": reached.to_numpy(dtype=np.int64)})
+
+@cached
+@timed
+def chart_frames(df: pd.DataFrame = None, date_start=None, date_end=None, user_id=DEFAULT_USER) -> dict:
+    """
+    Every per-day chart frame from one pass over the data, as a dict:
+    - 'daily': ['day', 'status', 'n']
+    - 'per_day': ['day', 'n']
+    - 'cumulative': ['day', 'cum']
+    - 'funnel': ['stage', 'n'] over FUNNEL_ORDER, by current status (see pipeline_funnel)
+    - 'weekday_status': ['weekday', 'status', 'n'], all 7 x len(STATUSES) cells
+    Without df the pass is over daily_rollup (one row per day and status), with df it is one
+    group-by of its rows. The rest is derived from those (day, status) counts, so a new chart
+    built here costs no extra scan.
     """
-    Return columns: ['day','n']
+    daily = daily_counts(date_start, date_end, user_id=user_id) if df is None else _daily_from_df(df)
+    if df is not None and date_start is not None:
+        daily = daily[daily["day"] >= pd.Timestamp(date_start).normalize()]
+    if df is not None and date_end is not None:
+        daily = daily[daily["day"] <= pd.Timestamp(date_end).normalize()]
+    daily = daily.dropna(subset=["day"]).sort_values(["day", "status"]).reset_index(drop=True)
+
+    per_day = daily.groupby("day")["n"].sum().reset_index()
+    status_n = daily.groupby("status", observed=False)["n"].sum()
+
+    weekday = pd.Categorical.from_codes(daily["day"].dt.dayofweek.to_numpy(), categories=WEEKDAYS, ordered=True)
+    weekday_status = (daily.groupby([weekday, daily["status"]], observed=False)["n"].sum()
+                      .rename_axis(["weekday", "status"]).reset_index())
+
+    return {
+        "daily": daily,
+        "per_day": per_day,
+        "cumulative": per_day.assign(cum=per_day["n"].cumsum())[["day", "cum"]],
+        "funnel": _funnel(status_n, FUNNEL_ORDER),
+        "weekday_status": weekday_status,
+    }
+
+@timed
+def apps_per_day(df: pd.DataFrame = None, user_id=DEFAULT_USER) -> pd.DataFrame:
     """
-    # ensure date_applied is datetime
-    # df.assign(day=df['date_applied'].dt.floor('D')).groupby('day').size().reset_index(name='n')
-    ...
+    Return columns: ['day','n'], over all the user's applications unless df is given
+    """
+    return chart_frames(df, user_id=user_id)["per_day"]
 
-def cumulative_apps(per_day_df: pd.DataFrame) -> pd.DataFrame:
+@timed
+def cumulative_apps(per_day_df: pd.DataFrame = None, user_id=DEFAULT_USER) -> pd.DataFrame:
     """
-    Input from apps_per_day(); return ['day','cum']
+    Input from apps_per_day() (all the user's applications when None); return ['day','cum']
     """
-    # per_day_df.assign(cum=per_day_df['n'].cumsum())
-    ...
+    if per_day_df is None:
+        return chart_frames(user_id=user_id)["cumulative"]
+    per_day_df = per_day_df.sort_values("day")
+    return per_day_df.assign(cum=per_day_df["n"].cumsum())[["day", "cum"]].reset_index(drop=True)
 
-def top_companies(df: pd.DataFrame, k: int = 15) -> pd.DataFrame:
+@timed
+def pipeline_funnel(df: pd.DataFrame = None, order=None, user_id=DEFAULT_USER) -> pd.DataFrame:
     """
-    Return ['company','n'] for top k.
+    Applications that reached each stage of an ordered pipeline, for a funnel.
+    Default order: ["Applied","OA","Interview","Offer"]
+    Without df, reached means the application had that status (or a later one) at some point,
+    from status_events. With df only the current status is known, so a stage counts every
+    application currently at or past it.
+    The first stage counts everything, including rejected ones.
+    Return ['stage','n'].
     """
-    
-    top_k_companies = df.sort_values('company').head(k)
+    order = FUNNEL_ORDER if order is None else list(order)
+    if df is not None:
+        if order == FUNNEL_ORDER:
+            return chart_frames(df)["funnel"]
+        return _funnel(chart_frames(df)["daily"].groupby("status", observed=False)["n"].sum(), order)
+    return _history_funnel(tuple(order), user_id)
+
+@cached
+def _history_funnel(order: tuple, user_id=DEFAULT_USER) -> pd.DataFrame:
+    # furthest stage each application ever reached, by its position in order
+    sql = """
+        SELECT furthest, COUNT(*) FROM (
+            SELECT e.app_id, MAX(CAST(j.key AS INTEGER)) AS furthest
+            FROM status_events e JOIN json_each(?) j ON j.value = e.status
+            WHERE e.user_id = ?
+            GROUP BY e.app_id
+        )
+        GROUP BY furthest
+        """
+    with get_connection() as conn:
+        rows = conn.execute(sql, (json.dumps(order), user_id)).fetchall()
+        total = conn.execute("SELECT COALESCE(SUM(n), 0) FROM stats WHERE user_id = ? AND scope = 'total'",
+                             (user_id,)).fetchone()[0]
 
-    apps_per_company = {}
+    furthest = pd.Series({order[r[0]]: r[1] for r in rows}, dtype=np.int64)
+    # applications that never had a status in order (only ever Rejected) still applied
+    furthest[None] = total - furthest.sum()
+    return _funnel(furthest, order)
 
-    for company in df["company"]:
-        if company not in apps_per_company:
-            apps_per_company[company] = 1
-        elif company in apps_per_company:
-            apps_per_company[company] += 1
+@timed
+def weekday_by_status(df: pd.DataFrame = None, user_id=DEFAULT_USER) -> pd.DataFrame:
+    """
+    Return heatmap-ready counts: ['weekday','status','n'], weekday ordered Monday..Sunday
+    """
+    return chart_frames(df, user_id=user_id)["weekday_status"]
+
+# each application's first status other than Applied, kept only for applications the log saw
+# in Applied first (imports that arrive at a later stage have no response date of their own).
+# Lags are whole days from date_applied (a.day + 2440587.5 is its julian day)
+_FIRST_RESPONSE_SQL = """
+    SELECT MAX(CAST(julianday(o.at) - (a.day + 2440587.5) AS INTEGER), 0) AS lag_days
+    FROM (
+        SELECT app_id, status, at,
+               FIRST_VALUE(status) OVER (PARTITION BY app_id ORDER BY at, id) AS first_status,
+               ROW_NUMBER() OVER (PARTITION BY app_id, status = 'Applied' ORDER BY at, id) AS nth
+        FROM status_events
+        WHERE user_id = ?
+    ) AS o
+    JOIN applications a ON a.id = o.app_id
+    WHERE o.first_status = 'Applied' AND o.status <> 'Applied' AND o.nth = 1
+    """
 
-    top_k_companies = pd.DataFrame(apps_per_company.items(), columns=['Company', 'Apps'])
-    top_k_companies = top_k_companies.sort_values('Apps', ascending=False).head(k)
+@timed
+def time_to_first_response(df: pd.DataFrame = None, user_id=DEFAULT_USER) -> pd.DataFrame:
+    """
+    Return ['lag_days'] for histogram: days from applying to the first response.
+    Without df it comes from status_events, with df from its 'response_date' column
+    (empty when there is none).
+    """
+    if df is None:
+        with get_connection() as conn:
+            rows = conn.execute(_FIRST_RESPONSE_SQL, (user_id,)).fetchall()
+        return pd.DataFrame({"lag_days": np.array([r[0] for r in rows], dtype=np.int64)})
+
+    if "response_date" not in df.columns:
+        return pd.DataFrame({"lag_days": pd.Series(dtype=np.int64)})
+    lag = _as_dates(df["response_date"]) - _as_dates(df["date_applied"])
+    return pd.DataFrame({"lag_days": lag.dropna().dt.days.astype(np.int64)}).reset_index(drop=True)
+
+@cached
+@timed
+def response_lag_histogram(bin_days: int = 7, user_id=DEFAULT_USER) -> pd.DataFrame:
+    """
+    time_to_first_response() binned in SQL: ['lag_days', 'n'] with lag_days the start of each
+    bin_days wide bin. Costs one row per bin however long the history is.
+    """
+    sql = f"""
+        SELECT (lag_days / ?) * ? AS bin, COUNT(*) FROM ({_FIRST_RESPONSE_SQL})
+        GROUP BY bin ORDER BY bin
+        """
+    with get_connection() as conn:
+        rows = conn.execute(sql, (bin_days, bin_days, user_id)).fetchall()
 
-    return top_k_companies
+    return pd.DataFrame({
+        "lag_days": np.array([r[0] for r in rows], dtype=np.int64),
+        "n": np.array([r[1] for r in rows], dtype=np.int64),
+    })
 
-def pipeline_funnel(df: pd.DataFrame, order=None) -> pd.DataFrame:
+@cached
+@timed
+def stage_timings(user_id=DEFAULT_USER) -> pd.DataFrame:
     """
-    Map free-form statuses into an ordered pipeline for a funnel.
-    Default order: ["Applied","OA","Interview","Offer"]
-    Return ['stage','n'].
+    Every status change seen in status_events, with how long applications sat in the previous
+    status: ['from_status', 'to_status', 'n', 'avg_days', 'min_days', 'max_days'], most common first.
     """
-    ...
+    sql = """
+        SELECT prev_status, status, COUNT(*) AS n, AVG(days), MIN(days), MAX(days)
+        FROM (
+            SELECT status,
+                   LAG(status) OVER w AS prev_status,
+                   julianday(at) - julianday(LAG(at) OVER w) AS days
+            FROM status_events
+            WHERE user_id = ?
+            WINDOW w AS (PARTITION BY app_id ORDER BY at, id)
+        )
+        WHERE prev_status IS NOT NULL
+        GROUP BY prev_status, status
+        ORDER BY n DESC, prev_status, status
+        """
+    with get_connection() as conn:
+        rows = conn.execute(sql, (user_id,)).fetchall()
+
+    return pd.DataFrame([tuple(r) for r in rows],
+                        columns=["from_status", "to_status", "n", "avg_days", "min_days", "max_days"])
+
+TOP_K_COLUMNS = ("company", "role", "status")
 
-def weekday_by_status(df: pd.DataFrame) -> pd.DataFrame:
+@cached
+@timed
+def top_k(column: str, k: int = 10, date_start=None, date_end=None, status=None, user_id=DEFAULT_USER) -> pd.DataFrame:
     """
-    Return heatmap-ready counts: ['weekday','status','n']
+    The k most common values of column ('company', 'role' or 'status') as [column, 'n'],
+    over all of one user's applications, optionally limited to a date_applied window and/or one status.
+    Answered from the trigger-maintained counters where they fit (daily_rollup for status,
+    company_counts/role_counts when there is no filter), otherwise with one GROUP BY
+    that the date and status indexes narrow down.
     """
-    # weekday = df['date_applied'].dt.day_name()
-    ...
+    if column not in TOP_K_COLUMNS:
+        raise ValueError(f"top_k column must be one of {TOP_K_COLUMNS}")
+
+    filtered = date_start is not None or date_end is not None or bool(status)
+    clauses = []
+    params = [user_id]
+
+    if column == "status":
+        # daily_rollup keeps text days and statuses
+        if date_start is not None:
+            clauses.append("day >= ?"); params.append(_iso_day(date_start))
+        if date_end is not None:
+            clauses.append("day <= ?"); params.append(_iso_day(date_end))
+        if status:
+            clauses.append("status = ?"); params.append(status)
+        where = "".join(" AND " + c for c in clauses)
+        sql = f"""
+            SELECT status, SUM(n) AS n FROM daily_rollup WHERE user_id = ?{where}
+            GROUP BY status HAVING n > 0
+            ORDER BY n DESC, status LIMIT ?"""
+    elif filtered:
+        # grouped on the integer ids, names are only looked up for the groups
+        if date_start is not None:
+            clauses.append("day >= ?"); params.append(day_number(date_start))
+        if date_end is not None:
+            clauses.append("day <= ?"); params.append(day_number(date_end))
+        if status:
+            clauses.append("status = ?"); params.append(status_code(status))
+        where = "".join(" AND " + c for c in clauses)
+        dim = "companies" if column == "company" else "roles"
+        sql = f"""
+            SELECT d.name AS {column}, g.n FROM (
+                SELECT {column}_id AS id, COUNT(*) AS n FROM applications WHERE user_id = ?{where}
+                GROUP BY {column}_id
+            ) AS g
+            JOIN {dim} AS d ON d.id = g.id
+            ORDER BY g.n DESC, d.name LIMIT ?"""
+    else:
+        sql = f"""
+            SELECT {column}, n FROM {column}_counts
+            WHERE user_id = ? AND n > 0
+            ORDER BY n DESC, {column} LIMIT ?"""
+    params.append(k)
+
+    with get_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+
+    return pd.DataFrame([tuple(r) for r in rows], columns=[column, "n"])
 
-def time_to_first_response(df: pd.DataFrame) -> pd.DataFrame:
+@cached
+@timed
+def top_companies(df: pd.DataFrame = None, k: int = 15, user_id=DEFAULT_USER, source=None) -> pd.DataFrame:
     """
-    If 'response_date' exists, return ['lag_days'] for histogram.
+    Return ['Company','Apps'] for top k, over all the user's applications (or over df when given).
     """
-    # dropna on response_date, compute (response_date - date_applied).dt.days as 'lag_days'
-
-def calendar_counts(df: pd.DataFrame, n_days=30, date_col="date_applied"):
-    dates = _normalize_dates(df[date_col]).dropna()
+    table = _snapshot_table(source, user_id) if df is None else None
+    if df is None and table is None:
+        top = top_k("company", k, user_id=user_id)
+    else:
+        if table is not None:
+            counts = _snapshot().value_counts(table, "company")
+        else:
+            counts = df["company"].value_counts()
+        top = counts.rename_axis("company").reset_index(name="n")
+        top = top.sort_values(["n", "company"], ascending=[False, True]).head(k)
+
+    return top.rename(columns={"company": "Company", "n": "Apps"}).reset_index(drop=True)
+
+@timed
+def calendar_counts(df: pd.DataFrame = None, n_days=30, date_col="date_applied", user_id=DEFAULT_USER, source=None):
     start, end = _window_bounds(n_days)
-    mask = (dates >= start) & (dates <= end)
-    dates = dates[mask]
+    # without a frame, count from daily_rollup (or the snapshot) instead of the raw rows
+    table = _snapshot_table(source, user_id) if df is None else None
+    if table is not None:
+        per_day = _snapshot().per_day(table, start, end)
+    elif df is None:
+        per_day = _per_day(daily_counts(start, end, user_id=user_id))
+    else:
+        dates = _normalize_dates(df[date_col]).dropna()
+        mask = (dates >= start) & (dates <= end)
+        per_day = dates[mask].value_counts()
 
     day_index = pd.date_range(start, end, freq="D")
-    counts = dates.value_counts().rename_axis("date").rename("n").to_frame()\
+    counts = per_day.rename("n").to_frame()\
         .reindex(day_index, fill_value=0)\
             .rename_axis("date").reset_index()
     
@@ -190,44 +498,129 @@ def calendar_counts(df: pd.DataFrame, n_days=30, date_col="date_applied"):
 
     return counts[["date", "n", "dow", "week_idx"]]
 
-def calendar_month_ticks(cal_counts):
-    if cal_counts is None or cal_counts.empty:
-        return [], []
-    s = cal_counts.assign(month=cal_counts["date"].dt.to_period("M"))
-    first_week = s.groupby("month", sort=True)["week_idx"].min()
-    tickvals = first_week.values.tolist()
-    ticktext = [m.strftime("%b") for m in first_week.index.to_timestamp()]
-
-    return tickvals, ticktext
-
+MONTH_ABBR = np.array(["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"])
 
-def _normalize_role(text: str):
-    cleaned = text.lower().strip()
-    cleaned = re.sub('\W_\s*', ' ', cleaned)
-    return cleaned
+def _month_ticks(days, grid_start, step):
+    # (week column, label) of the first in-range day of every step-th month, with the year
+    # on the first tick and on each January
+    months = days.astype("datetime64[M]")
+    first = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+    first = first[months[first].astype(np.int64) % step == 0]
+    month_no = months[first].astype(np.int64) % 12
+    years = months[first].astype("datetime64[Y]").astype(np.int64) + 1970
 
-def top_role_terms(df, n=20, ngram_range=(1, 2)):
-    roles = df['role'].astype(str).map(_normalize_role)
-    v = CountVectorizer(ngram_range=ngram_range,
-                        min_df=2,
-                        stop_words=['summer', 'fall', 'spring', 'jr', 'sr', 'the', 'and', 'of', 'for', 'with',
-                                    'to', 'a', 'an', 'job', '2025', "id", 'hybrid', 'graduate', "i", "ii", "iii", "usds", "2026",
-                                    "new", "grad", "program", "internship", "intern", "staff", "co", "op"])
-    
-    X = v.fit_transform(roles)
-    counts = np.asarray(X.sum(axis=0)).ravel()
-    terms = v.get_feature_names_out()
+    tickvals = ((days[first] - grid_start).astype(np.int64) // 7).tolist()
+    ticktext = [f"{MONTH_ABBR[m]} {y}" if i == 0 or m == 0 else str(MONTH_ABBR[m])
+                for i, (m, y) in enumerate(zip(month_no, years))]
+    return tickvals, ticktext
 
-    out = pd.DataFrame({'term': terms,
-                        'count': counts})
-    
-    df_sorted = out.sort_values(by="count", ascending=False)
-    df_sorted.index = pd.CategoricalIndex(df_sorted.index,
-                                       categories=df_sorted.index,
-                                       ordered=True)
+@timed
+def calendar_heatmap(df: pd.DataFrame = None, date_start=None, date_end=None, n_days: int = 175,
+                     date_col="date_applied", user_id=DEFAULT_USER, source=None) -> dict:
+    """
+    Everything the calendar heatmap draws, for [date_start, date_end] (by default the n_days up
+    to today), as a dict:
+    - 'counts': float (7, W) matrix of applications per day, rows Monday..Sunday, one column per
+      week; NaN for the days before the start and after the end in the first and last week
+    - 'labels': (7, W) matrix of 'YYYY-MM-DD' strings for the hover text
+    - 'tickvals', 'ticktext': month ticks on the week axis (every month up to 18 months,
+      quarterly up to 4 years, yearly beyond)
+    One np.bincount over the day offsets, however many years the range covers.
+    """
+    # "today" is worked out here, outside the cache, so a cached grid never outlives its day
+    end = pd.Timestamp(date_end if date_end is not None else pd.Timestamp.today()).normalize()
+    start = pd.Timestamp(date_start).normalize() if date_start is not None else end - pd.Timedelta(days=n_days - 1)
+    if start > end:
+        raise ValueError("date_start must not be after date_end")
+    return _calendar_heatmap(df, start, end, date_col, user_id, source)
+
+@cached
+def _calendar_heatmap(df, start, end, date_col="date_applied", user_id=DEFAULT_USER, source=None):
+    # per-day counts as (datetime64[D] days, n) arrays
+    table = _snapshot_table(source, user_id) if df is None else None
+    if table is not None:
+        per_day = _snapshot().per_day(table, start, end)
+        days, n = per_day.index.to_numpy(dtype="datetime64[D]"), per_day.to_numpy()
+    elif df is None:
+        daily = daily_counts(start, end, user_id=user_id)
+        days, n = daily["day"].to_numpy(dtype="datetime64[D]"), daily["n"].to_numpy()
+    else:
+        days = _as_dates(df[date_col]).dropna().to_numpy(dtype="datetime64[D]")
+        n = np.ones(len(days), dtype=np.int64)
+
+    first_day = np.datetime64(start.date(), "D")
+    last_day = np.datetime64(end.date(), "D")
+    grid_start = first_day - (first_day.astype(np.int64) - 4) % 7  # 1970-01-01 was a Thursday
+    n_weeks = int((last_day - grid_start).astype(np.int64)) // 7 + 1
+
+    offset = (days - grid_start).astype(np.int64)
+    keep = (days >= first_day) & (days <= last_day)
+    counts = np.bincount(offset[keep], weights=n[keep], minlength=7 * n_weeks).astype(float)
+
+    lead = int((first_day - grid_start).astype(np.int64))
+    trail = 7 * n_weeks - int((last_day - grid_start).astype(np.int64)) - 1
+    counts[:lead] = np.nan
+    counts[len(counts) - trail:] = np.nan
+
+    grid = grid_start + np.arange(7 * n_weeks)
+    n_months = (last_day.astype("datetime64[M]") - first_day.astype("datetime64[M]")).astype(np.int64) + 1
+    step = 1 if n_months <= 18 else 3 if n_months <= 48 else 12
+    tickvals, ticktext = _month_ticks(grid[lead:len(grid) - trail], grid_start, step)
+
+    # cells run down each week first, so (W, 7) transposed is weekday x week
+    return {
+        "counts": counts.reshape(n_weeks, 7).T,
+        "labels": np.datetime_as_string(grid, unit="D").reshape(n_weeks, 7).T,
+        "tickvals": tickvals,
+        "ticktext": ticktext,
+    }
+
+
+def _top_terms_from_roles(role_n: pd.Series, n, ngram_range, min_df):
+    # same counting as the SQL in top_role_terms, from applications per distinct role
+    lo, hi = ngram_range
+    count, docs = Counter(), Counter()
+    for role, times in role_n.items():
+        for term, cnt in role_ngrams(role, hi).items():
+            if term.count(" ") + 1 >= lo:
+                count[term] += cnt * times
+                docs[term] += times
+
+    top = sorted(((t, c) for t, c in count.items() if docs[t] >= min_df), key=lambda tc: (-tc[1], tc[0]))[:n]
+    return pd.DataFrame(top, columns=["term", "count"])
+
+@cached
+@timed
+def top_role_terms(df=None, n=20, ngram_range=(1, 2), min_df=2, user_id=DEFAULT_USER, source=None):
+    """
+    Top n role-title terms (n-grams of ngram_range words, in at least min_df applications)
+    as ['term', 'count'], over all of one user's applications.
+    Only reads the role_counts/role_terms index (db.py fills role_terms when a title is first
+    stored), so the cost follows the number of distinct role titles, not the number of applications.
+    """
+    if df is not None:
+        return _top_terms_from_roles(df["role"].astype(str).value_counts(), n, ngram_range, min_df)
 
-    return df_sorted.head(10)
+    table = _snapshot_table(source, user_id)
+    if table is not None:
+        return _top_terms_from_roles(_snapshot().value_counts(table, "role"), n, ngram_range, min_df)
 
+    lo, hi = ngram_range
+    if hi > MAX_ROLE_NGRAM:
+        raise ValueError(f"role_terms only holds n-grams of up to {MAX_ROLE_NGRAM} words")
 
+    sql = """
+        SELECT t.term, SUM(t.cnt * c.n) AS count
+        FROM role_terms AS t
+        JOIN role_counts AS c ON c.role = t.role
+        WHERE c.user_id = ? AND c.n > 0 AND t.words BETWEEN ? AND ?
+        GROUP BY t.term
+        HAVING SUM(c.n) >= ?
+        ORDER BY count DESC, t.term
+        LIMIT ?
+        """
 
+    with get_connection() as conn:
+        rows = conn.execute(sql, (user_id, lo, hi, min_df, n)).fetchall()
 
+    return pd.DataFrame([tuple(r) for r in rows], columns=["term", "count"])
@@ -1,16 +1,27 @@
+import functools
 from pathlib import Path
 
-try:
-    import playsound as _playsound
-except Exception:
-    _playsound = None
+import streamlit as st
 
 SOUND_PATH = Path(__file__).parent / "assets" / "success.mp3"
 
-def play_success():
-    if _playsound is None:
-        return
+
+@functools.cache
+def _sound_bytes():
+    # read once per process, every session shares the same bytes
     try:
-        _playsound.playsound(str(SOUND_PATH))
-    except Exception as e:
+        return SOUND_PATH.read_bytes()
+    except OSError as e:
         print(f"Audio error: {e}")
+        return None
+
+
+def play_success():
+    """
+    Play the success sound in the user's browser.
+    This only adds an autoplaying <audio> element to the page, so the script run doesn't wait
+    for the clip (and nothing plays on the server).
+    """
+    data = _sound_bytes()
+    if data is not None:
+        st.audio(data, format="audio/mpeg", autoplay=True)
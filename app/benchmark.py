@@ -0,0 +1,249 @@
+"""
+Benchmarks for the hot paths in db.py, importer.py and analytics.py, with timings and peak
+traced memory (tracemalloc slows Python-heavy code down, compare runs with each other, not
+with production). Runs against a throwaway database filled by sample_data, never job_apps.db.
+Read benchmarks run with the result cache cleared, so they time the real work.
+
+    python benchmark.py --rows 100000
+    python benchmark.py --rows 1000000 --only filters analytics
+    python benchmark.py --imports       # cold-start import times only
+"""
+import argparse
+import datetime as dt
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+import analytics
+import db
+import sample_data
+import snapshot
+from importer import FIELDS, import_csv, sniff_csv
+
+
+def measure(fn, *args, **kwargs):
+    """Run fn once, return (result, seconds, peak traced memory in MB)"""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, seconds, peak / 1e6
+
+
+def report(name, seconds, peak_mb, rows=None):
+    per_sec = f"{rows / seconds:>12,.0f} rows/s" if rows else ""
+    print(f"{name:<40} {seconds * 1000:>10.1f} ms {peak_mb:>9.1f} MB {per_sec}")
+
+
+# what a cold ui.py run imports before it can draw the Applications tab, then what the
+# Analytics tab adds on top
+STARTUP_MODULES = ["streamlit", "pandas", "db", "importer", "audio", "exporter", "profiling"]
+LAZY_MODULES = ["analytics", "altair", "plotly.express", "streamlit_authenticator"]
+
+
+def import_time(module, preload=()):
+    """
+    Cumulative import time of module in seconds, from `python -X importtime` in a fresh
+    interpreter. Modules in preload are imported first and not counted.
+    """
+    marker = "-- preloaded --"
+    code = ("".join(f"import {m}\n" for m in preload)
+            + f"import sys; sys.stderr.write({marker!r} + '\\n')\nimport {module}")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=Path(__file__).parent, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    # lines look like "import time:   self [us] | cumulative | imported package",
+    # the top-level package shows up unindented with its cumulative time
+    total = 0
+    for line in proc.stderr.split(marker, 1)[1].splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            total += int(cumulative)
+    return total / 1e6
+
+
+def bench_import_time():
+    """Cold-start import cost of the modules ui.py loads up front and those it loads lazily"""
+    startup = 0.0
+    for module in STARTUP_MODULES:
+        seconds = import_time(module, STARTUP_MODULES[:STARTUP_MODULES.index(module)])
+        startup += seconds
+        print(f"{'import ' + module:<40} {seconds * 1000:>10.1f} ms")
+    print(f"{'cold start (Applications tab)':<40} {startup * 1000:>10.1f} ms")
+
+    for module in LAZY_MODULES:
+        try:
+            seconds = import_time(module, STARTUP_MODULES)
+        except RuntimeError as err:
+            print(f"{'import ' + module:<40} {'skipped':>13} ({err})")
+            continue
+        print(f"{'import ' + module + ' (lazy)':<40} {seconds * 1000:>10.1f} ms")
+
+
+def bench_populate(n_rows, seed=7):
+    """Fill the empty benchmark database through sample_data (the import_batches path)"""
+    result, seconds, peak = measure(sample_data.populate, n_rows, seed=seed)
+    report("sample_data.populate", seconds, peak, result["inserted"])
+
+
+def _dict_rows_frame(limit):
+    # the old result path: one dict per sqlite3.Row, dates parsed afterwards
+    with db.get_connection() as conn:
+        rows = conn.execute(
+            "SELECT id, company, role, date_applied, status FROM applications_text ORDER BY id LIMIT ?",
+            (limit,)).fetchall()
+    df = pd.DataFrame([dict(r) for r in rows])
+    df["date_applied"] = pd.to_datetime(df["date_applied"], errors="coerce")
+    return df
+
+
+def bench_result_path(n_rows):
+    """dict-per-row frame vs the typed column-wise frame from list_applications_df"""
+    df, seconds, peak = measure(_dict_rows_frame, n_rows)
+    report("rows -> dicts -> DataFrame", seconds, peak, len(df))
+    print(f"{'':<40} {df.memory_usage(deep=True).sum() / 1e6:>10.1f} MB frame")
+
+    df, seconds, peak = measure(db.list_applications_df, limit=n_rows)
+    report("list_applications_df (column-wise)", seconds, peak, len(df))
+    print(f"{'':<40} {df.memory_usage(deep=True).sum() / 1e6:>10.1f} MB frame")
+
+
+def bench_filters():
+    """list_applications_df with each filter on its own and all together"""
+    today = dt.date.today()
+    # a word that is sure to be in some company names at any --rows
+    company_word = db.list_applications_df(limit=1)["company"].iloc[0].split()[0]
+    cases = {
+        "no filter, limit 100": {},
+        "no filter, all rows": {"limit": -1},
+        "status": {"status": "Interview", "limit": -1},
+        "date window (30 days)": {"date_start": today - dt.timedelta(days=30), "date_end": today, "limit": -1},
+        f"company contains {company_word!r}": {"company_substr": company_word, "limit": -1},
+        "role contains": {"role_substr": "Engineer", "limit": -1},
+        "all filters": {"status": "Applied", "date_start": today - dt.timedelta(days=90),
+                        "company_substr": company_word, "role_substr": "Engineer", "limit": -1},
+    }
+    for name, filters in cases.items():
+        db.clear_cache()
+        df, seconds, peak = measure(db.list_applications_df, **filters)
+        report(f"list_applications_df: {name}", seconds, peak, len(df))
+
+    db.clear_cache()
+    (df, _), seconds, peak = measure(db.list_applications_page, page_size=100)
+    report("list_applications_page: first page", seconds, peak, len(df))
+
+
+def bench_writes(n_rows, tmp):
+    """bulk insert, CSV import and the editor's batched apply"""
+    # another seed and date span, so most rows are new rather than upserts
+    rows = [row for batch in sample_data.generate_batches(10_000, seed=99, start="2000-01-01", end="2000-12-31")
+            for row in batch]
+    result, seconds, peak = measure(db.bulk_insert_applications, rows)
+    report("bulk_insert_applications (10k)", seconds, peak, len(rows))
+
+    csv_rows = max(n_rows // 10, 1000)
+    path = sample_data.write_csv(Path(tmp) / "bench.csv", csv_rows, seed=98, start="2001-01-01",
+                                 end="2001-12-31", aliases=True)
+    with open(path, "rb") as file:
+        encoding, delimiter = sniff_csv(file)
+        result, seconds, peak = measure(import_csv, file, {f: f for f in FIELDS}, encoding, delimiter)
+    report(f"import_csv ({csv_rows:,} rows)", seconds, peak, result["rows"])
+
+    # what ui.apply_changes sends after a big editor session
+    ids = db.list_applications_df(limit=1100)["id"].tolist()
+    updates = [(app_id, "Interview") for app_id in ids[:1000]]
+    result, seconds, peak = measure(db.apply_batch, updates, ids[1000:])
+    report("apply_batch (1000 updates, 100 deletes)", seconds, peak, len(result))
+
+
+def bench_analytics():
+    """Every analytics.py entry point, cold (cache cleared before each)"""
+    df = db.list_applications_df(limit=10_000)
+    cases = {
+        "summary": analytics.summary,
+        "count_apps_this_week": analytics.count_apps_this_week,
+        "get_status_count": lambda: analytics.get_status_count("Offer"),
+        "daily_counts": analytics.daily_counts,
+        "chart_frames": analytics.chart_frames,
+        "chart_frames(df 10k)": lambda: analytics.chart_frames(df),
+        "weekly_applications": analytics.weekly_applications,
+        "apps_per_day": analytics.apps_per_day,
+        "cumulative_apps": analytics.cumulative_apps,
+        "pipeline_funnel (history)": analytics.pipeline_funnel,
+        "weekday_by_status": analytics.weekday_by_status,
+        "time_to_first_response": analytics.time_to_first_response,
+        "response_lag_histogram": analytics.response_lag_histogram,
+        "stage_timings": analytics.stage_timings,
+        "calendar_counts (175 days)": lambda: analytics.calendar_counts(n_days=175),
+        "calendar_heatmap (175 days)": lambda: analytics.calendar_heatmap(n_days=175),
+        "calendar_heatmap (5 years)": lambda: analytics.calendar_heatmap(n_days=5 * 365),
+        "top_k company": lambda: analytics.top_k("company", 15),
+        "top_k role, 90 day window": lambda: analytics.top_k(
+            "role", 15, date_start=dt.date.today() - dt.timedelta(days=90)),
+        "top_k status": lambda: analytics.top_k("status"),
+        "top_companies": analytics.top_companies,
+        "top_role_terms": lambda: analytics.top_role_terms(n=10, ngram_range=(2, 3)),
+        # no file yet, so this builds it from the whole table
+        "snapshot build": snapshot.applications_table,
+        "weekly_applications (snapshot)": lambda: analytics.weekly_applications(source="snapshot"),
+        "calendar_counts (snapshot)": lambda: analytics.calendar_counts(n_days=175, source="snapshot"),
+        "top_companies (snapshot)": lambda: analytics.top_companies(source="snapshot"),
+        "top_role_terms (snapshot)": lambda: analytics.top_role_terms(n=10, ngram_range=(2, 3), source="snapshot"),
+    }
+    for name, fn in cases.items():
+        db.clear_cache()
+        _, seconds, peak = measure(fn)
+        report(name, seconds, peak)
+
+
+SUITES = ["import-time", "result-path", "filters", "writes", "analytics"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--only", nargs="+", choices=SUITES, default=SUITES, metavar="SUITE",
+                        help=f"run only these suites: {', '.join(SUITES)}")
+    parser.add_argument("--imports", action="store_true", help="only measure import times")
+    args = parser.parse_args()
+    suites = ["import-time"] if args.imports else args.only
+
+    if "import-time" in suites:
+        bench_import_time()
+    if suites == ["import-time"]:
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.set_db_path(Path(tmp) / "bench.db")
+        db.init_db()
+        bench_populate(args.rows, args.seed)
+
+        if "result-path" in suites:
+            bench_result_path(args.rows)
+        if "filters" in suites:
+            bench_filters()
+        if "analytics" in suites:
+            bench_analytics()
+        # last, it changes the data the other suites read
+        if "writes" in suites:
+            bench_writes(args.rows, tmp)
+
+        db.get_pool().close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,346 @@
+import functools
+import json
+import re
 import sqlite3
+import threading
+from collections import Counter, OrderedDict
 from pathlib import Path
 import datetime as dt
+import numpy as np
 import pandas as pd
 
-DB_PATH = Path(__file__).parent / "job_apps.db"
-COUNTER_PATH = ".next_id"
+from migrations import migrate, LATEST_VERSION
+from profiling import ProfiledConnection, timed
 
+DB_PATH = Path(__file__).parent / "job_apps.db"
 
-# Open connection to DB_PATH
-# Turn on foreign keys
-# Set a row factory so you access columns by name
-# Return connection
+# Pragmas run once, when the pool opens a connection.
+# journal_mode is stored in the db file, the others only last for the connection.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA foreign_keys = ON;",
+    "PRAGMA busy_timeout = 5000;",
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA cache_size = -16000;",
+    "PRAGMA mmap_size = 134217728;",
+)
+POOL_SIZE = 8
+STATEMENT_CACHE_SIZE = 256
+
+STATUSES = ["Applied", "OA", "Interview", "Offer", "Rejected"]
+
+# owner of every row when no auth is configured, and of rows from before there were users.
+# Everything that reads or writes applications takes a user_id and only sees that user's rows
+DEFAULT_USER = ""
+STATUS_DTYPE = pd.CategoricalDtype(STATUSES)
+
+# applications stores status as its index in STATUSES and date_applied as a day number,
+# days since 1970-01-01 (see migration 11)
+_EPOCH = dt.date(1970, 1, 1)
+
+
+def day_number(d):
+    """A date (date, datetime, Timestamp or ISO string) as the day number applications stores"""
+    if isinstance(d, dt.datetime):
+        d = d.date()
+    elif not isinstance(d, dt.date):
+        d = pd.Timestamp(d).date()
+    return (d - _EPOCH).days
+
+
+def status_code(status):
+    """A status as the code applications stores"""
+    try:
+        return STATUSES.index(status)
+    except ValueError:
+        raise ValueError(f"Unknown status {status!r}, expected one of {STATUSES}") from None
+
+# trigram tokens are 3 characters, shorter search strings have to use LIKE
+FTS_MIN_CHARS = 3
+FTS_ENABLED = None
+
+
+class ConnectionPool:
+    """
+    Keeps idle connections to one database file so queries don't pay for connect + pragmas every time.
+    A connection is only ever used by one thread at a time, but it can move between threads
+    (Streamlit runs each rerun on a new thread), hence check_same_thread=False.
+    Up to `size` idle connections are kept, extra ones are closed when released.
+    """
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "reused": 0, "closed": 0, "in_use": 0, "peak_in_use": 0}
+
+    def _open(self):
+        # ProfiledConnection times every statement when profiling is on (see profiling.py)
+        conn = sqlite3.connect(self.path, check_same_thread=False, factory=ProfiledConnection,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._stats["opened"] += 1
+            else:
+                self._stats["reused"] += 1
+            self._stats["in_use"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._stats["in_use"])
+
+        if conn is None:
+            try:
+                conn = self._open()
+            except Exception:
+                with self._lock:
+                    self._stats["in_use"] -= 1
+                raise
+        return conn
+
+    def release(self, conn):
+        # never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+
+        with self._lock:
+            self._stats["in_use"] -= 1
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+            self._stats["closed"] += 1
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._stats["closed"] += len(idle)
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "idle": len(self._idle), "size": self.size}
+
+
+class PooledConnection:
+    """
+    What get_connection() returns. Use it as `with get_connection() as conn:`.
+    Commits on success and rolls back on error like sqlite3.Connection does,
+    then gives the connection back to the pool.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+        self.changes_at_enter = 0
+
+    def __enter__(self):
+        self.conn = self.pool.acquire()
+        self.changes_at_enter = self.conn.total_changes
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        conn, self.conn = self.conn, None
+        try:
+            if exc_type is None:
+                # anything written through db.py invalidates cached results
+                if conn.total_changes != self.changes_at_enter:
+                    _bump_data_version(conn)
+                conn.commit()
+            else:
+                conn.rollback()
+        finally:
+            self.pool.release(conn)
+        return False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+# Borrow a connection from the pool (WAL mode, foreign keys on, rows accessible by column name)
 def get_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
+    return PooledConnection(get_pool())
 
-def init_db():
-    sql = """
-    CREATE TABLE IF NOT EXISTS applications (
-        id  INTEGER PRIMARY KEY AUTOINCREMENT,
-        company TEXT    NOT NULL,
-        role    TEXT    NOT NULL,
-        date_applied    TEXT    NOT NULL,
-        status  TEXT    NOT NULL,
-        CONSTRAINT  status_allowed  CHECK   (status IN (
-            'Applied', 'OA', 'Interview', 'Offer', 'Rejected'
-            ))
-    );
-        """
-    
-    with get_connection() as conn:
-        conn.execute(sql)
 
-    sql_applications_date = """
-    CREATE INDEX IF NOT EXISTS idx_applications_status_date ON applications(status, date_applied);
+def pool_stats():
+    """Counters for the connection pool: opened, reused, closed, in_use, peak_in_use, idle, size"""
+    return get_pool().stats()
+
+
+def _bump_data_version(conn):
+    try:
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_version'")
+    except sqlite3.OperationalError:
+        # meta doesn't exist until init_db has run
+        pass
+
+
+def data_version():
+    """
+    Counter bumped in the same transaction as every write made through get_connection().
+    Cached results are only reused while it stays the same, in this process or any other.
+    """
+    try:
+        with get_connection() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+# Result cache, shared by every session in the process
+CACHE_SIZE = 128
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _cache_copy(value):
+    # callers add columns to / sort the frames they get back, so never hand out the cached object
+    if isinstance(value, (pd.DataFrame, np.ndarray)):
+        return value.copy()
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, dict):
+        return {k: _cache_copy(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return tuple(_cache_copy(v) for v in value)
+    return value
+
+
+def cached(fn):
+    """
+    Memoize a read function on its arguments and data_version(), in a bounded LRU.
+    Calls with unhashable arguments (e.g. a DataFrame) are passed straight through.
     """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (fn.__module__, fn.__qualname__, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return fn(*args, **kwargs)
 
-    with get_connection() as conn:
-        conn.execute(sql_applications_date)
+        version = data_version()
+        if version is None:
+            return fn(*args, **kwargs)
 
-    sql_company = """
-    CREATE INDEX IF NOT EXISTS idx_applications_company ON applications(company)"""
+        with _cache_lock:
+            entry = _cache.get(key)
+            if entry is not None and entry[0] == version:
+                _cache.move_to_end(key)
+                _cache_stats["hits"] += 1
+                return _cache_copy(entry[1])
+            _cache_stats["misses"] += 1
 
-    with get_connection() as conn:
-        conn.execute(sql_company)
+        value = fn(*args, **kwargs)
 
-    print("Database initialized")
+        with _cache_lock:
+            _cache[key] = (version, value)
+            _cache.move_to_end(key)
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+                _cache_stats["evictions"] += 1
 
-    return
+        return _cache_copy(value)
+
+    return wrapper
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def cache_stats():
+    """hits, misses, evictions and current size of the result cache"""
+    with _cache_lock:
+        return {**_cache_stats, "size": len(_cache), "max_size": CACHE_SIZE}
 
-def seed_sample_row():
+
+def set_db_path(path):
+    """Point db.py at another database file (benchmarks, scripts). Idle pooled connections are closed"""
+    global DB_PATH, _pool, FTS_ENABLED
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        DB_PATH = Path(path)
+        _pool = None
+        FTS_ENABLED = None
+    clear_cache()
+
+
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def init_db():
+    """
+    Bring the database up to the current schema (see migrations.py). Only the first call for
+    a database file in this process does any work, every later call (each Streamlit rerun) is
+    a set lookup. Other processes migrating the same file are waited for (see migrations.migrate).
+    Returns the schema version.
+    """
+    path = str(DB_PATH)
+    if path in _migrated:
+        return LATEST_VERSION
+
+    with _migrate_lock:
+        if path not in _migrated:
+            with get_connection() as conn:
+                if migrate(conn):
+                    clear_cache()
+                _index_missing_roles(conn)
+                _stop_change_log(conn)
+            _migrated.add(path)
+
+    return LATEST_VERSION
+
+
+def _stop_change_log(conn):
+    # app_changes is only logged for snapshot.py, which turns logging on when it builds its file.
+    # A new process can't tell whether anything still reads the snapshot, so logging stops and
+    # the log is dropped. The next snapshot read rebuilds the file once and turns it back on
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'change_log_since'").fetchone() is not None:
+        conn.execute("DELETE FROM meta WHERE key = 'change_log_since'")
+        conn.execute("DELETE FROM app_changes")
+
+
+def _fts_enabled(conn):
+    global FTS_ENABLED
+    if FTS_ENABLED is None:
+        FTS_ENABLED = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'applications_fts'"
+        ).fetchone() is not None
+    return FTS_ENABLED
+
+
+def _fts_phrase(column: str, text: str):
+    # column-scoped phrase, quotes escaped the fts5 way
+    return f'{column} : "' + text.replace('"', '""') + '"'
+
+def seed_sample_row(user_id=DEFAULT_USER):
     row_count = """
-    SELECT COUNT(*) FROM applications;
+    SELECT COUNT(*) FROM applications WHERE user_id = ?;
     """
 
     with get_connection() as conn:
-        row = conn.execute(row_count).fetchone()
+        row = conn.execute(row_count, (user_id,)).fetchone()
     
     if row[0] > 0:
         return None
@@ -67,140 +350,500 @@ def seed_sample_row():
         date_applied =dt.date.today().isoformat()
         status = "Applied"
 
-        sql = """
+        row_id = add_application(company, role, date_applied, status, user_id=user_id)
+
+        return(row_id)
+
+
+# company and role names are stored once, applications refers to them by id.
+# RETURNING only gives back names that were new
+_SQL_INTERN_COMPANY = "INSERT INTO companies (name) VALUES (?) ON CONFLICT (name) DO NOTHING"
+_SQL_INTERN_ROLE = "INSERT INTO roles (name) VALUES (?) ON CONFLICT (name) DO NOTHING RETURNING name"
+
+# words left out of the role terms
+ROLE_STOPWORDS = frozenset([
+    'summer', 'fall', 'spring', 'jr', 'sr', 'the', 'and', 'of', 'for', 'with',
+    'to', 'a', 'an', 'job', '2025', "id", 'hybrid', 'graduate', "i", "ii", "iii", "usds", "2026",
+    "new", "grad", "program", "internship", "intern", "staff", "co", "op"
+])
+# longest n-gram stored in role_terms
+MAX_ROLE_NGRAM = 3
+# same token rule as sklearn's CountVectorizer: words of 2+ characters
+_TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+
+
+def role_ngrams(role: str, max_n: int = MAX_ROLE_NGRAM):
+    """
+    Counter of the 1..max_n word n-grams in a role title: lower-cased 2+ character words,
+    stop words dropped before joining (like CountVectorizer does).
+    """
+    words = [w for w in _TOKEN_RE.findall(str(role).lower()) if w not in ROLE_STOPWORDS]
+    grams = Counter()
+    for size in range(1, max_n + 1):
+        for i in range(len(words) - size + 1):
+            grams[" ".join(words[i:i + size])] += 1
+    return grams
+
+
+def _index_roles(conn, roles):
+    # role_terms gets a title's n-grams when the title is first stored, in the same transaction,
+    # so analytics.top_role_terms only ever reads. Shared by all users
+    conn.executemany(
+        "INSERT OR REPLACE INTO role_terms (role, term, words, cnt) VALUES (?, ?, ?, ?)",
+        [(role, term, term.count(" ") + 1, cnt) for role in roles for term, cnt in role_ngrams(role).items()])
+
+
+def _index_missing_roles(conn):
+    # titles stored before role_terms was filled on write (it used to be filled by the first
+    # top_role_terms read). Titles made only of stop words have no terms and are looked at again
+    missing = [r[0] for r in conn.execute(
+        "SELECT name FROM roles WHERE name NOT IN (SELECT role FROM role_terms)")]
+    if missing:
+        _index_roles(conn, missing)
+
+
+@timed
+def add_application(company: str, role: str, date_applied: dt.date|str, status: str, user_id=DEFAULT_USER):
+    """
+    Insert one application and return its id, allocated by sqlite (AUTOINCREMENT + RETURNING).
+    The same (company, role, date_applied) added twice by one user just takes the new status and keeps its id.
+    """
+    if not company or not role or date_applied is None or status not in STATUSES:
+        raise ValueError("Company, role, date applied and a valid status are required")
+
+    sql = """
         INSERT INTO applications
-        (company, role, date_applied, status)
-        VALUES (?, ?, ?, ?)
+        (user_id, company_id, role_id, day, status)
+        VALUES (?, (SELECT id FROM companies WHERE name = ?), (SELECT id FROM roles WHERE name = ?), ?, ?)
+        ON CONFLICT (user_id, company_id, role_id, day) DO UPDATE SET status = excluded.status
+        RETURNING id
         """
 
-        with get_connection() as conn:
-            cur = conn.execute(sql, (company, role, date_applied, status))
-            row_id = cur.lastrowid
+    with get_connection() as conn:
+        conn.execute(_SQL_INTERN_COMPANY, (company,))
+        _index_roles(conn, [r[0] for r in conn.execute(_SQL_INTERN_ROLE, (role,))])
+        row_id = conn.execute(sql, (user_id, company, role, day_number(date_applied), status_code(status))).fetchone()[0]
 
-        return(row_id)
-    
-def init_id_counter_if_missing(df):
+    return row_id
+
+
+@timed
+def import_batches(batches, on_conflict="update", progress=None, user_id=DEFAULT_USER):
     """
-    Initialize .next_id to max(app_id)+1 (or 1 if empty) if .next_id is empty
-    Call once on app startup after loading dataframe
+    Upsert an iterable of row batches, each a list of (company, role, date_applied, status),
+    all in one transaction and all owned by user_id. Rows are matched on the user's
+    (company, role, date_applied):
+    on_conflict="update" takes the imported status, "skip" leaves the existing row alone.
+    A key that appears more than once in the import (in any batches) is applied once, with its
+    last row, the others count as skipped.
+
+    Every batch goes into a temp staging table first. Once all are staged, the new company and
+    role names go into companies/roles and then the rows into applications with a single
+    INSERT ... SELECT that swaps names, dates and statuses for their ids and codes. A row-by-row
+    executemany into applications would make the FTS trigger flush the search index once per row,
+    which is several times slower.
+
+    progress(rows_done) is called after every batch is staged.
+    Returns {'inserted', 'updated', 'skipped', 'batches'}, 'batches' is the number of batches read.
     """
-    import os
-    if os.path.exists(COUNTER_PATH):
-        return
-    
-    next_id = (int(df["app_id"].max()) + 1) if ("app_id" in df and len(df)) else 1
-    with open(COUNTER_PATH, "w") as f:
-        f.write(str(next_id))
+    if on_conflict == "update":
+        # rows whose status is already the imported one count as skipped, not updated
+        conflict_sql = "DO UPDATE SET status = excluded.status WHERE status IS NOT excluded.status"
+    elif on_conflict == "skip":
+        conflict_sql = "DO NOTHING"
+    else:
+        raise ValueError("on_conflict must be 'update' or 'skip'")
+
+    sql_stage = """
+        CREATE TEMP TABLE IF NOT EXISTS import_stage (
+            company TEXT, role TEXT, date_applied TEXT, status TEXT
+        )"""
+
+    # a repeated key keeps only its last row, upserting them one after another would report
+    # (and log to status_events) a change on every re-import of the same file
+    sql_dedupe = """
+        DELETE FROM import_stage WHERE rowid NOT IN (
+            SELECT MAX(rowid) FROM import_stage
+            GROUP BY company, role, CAST(strftime('%s', date_applied) AS INTEGER) / 86400
+        )"""
+
+    sql_intern = """
+        INSERT INTO {table} (name) SELECT DISTINCT {column} FROM import_stage WHERE true
+        ON CONFLICT (name) DO NOTHING RETURNING name"""
+
+    # WHERE true: sqlite needs it to parse ON CONFLICT after INSERT ... SELECT
+    sql = f"""
+        INSERT INTO applications (user_id, company_id, role_id, day, status)
+        SELECT ?, c.id, r.id, CAST(strftime('%s', s.date_applied) AS INTEGER) / 86400, st.code
+        FROM import_stage AS s
+        JOIN companies AS c ON c.name = s.company
+        JOIN roles AS r ON r.name = s.role
+        JOIN statuses AS st ON st.name = s.status
+        WHERE true
+        ON CONFLICT (user_id, company_id, role_id, day) {conflict_sql}"""
+
+    staged = 0
+    n_batches = 0
+    with get_connection() as conn:
+        conn.execute(sql_stage)
+        for rows in batches:
+            n_batches += 1
+            if rows:
+                conn.executemany("INSERT INTO import_stage VALUES (?, ?, ?, ?)", rows)
+                staged += len(rows)
 
+            if progress is not None:
+                progress(staged)
 
-def get_next_id():
-    """Read current next id (int) from .next_id (assuming it exists)"""
-    with open(COUNTER_PATH) as f:
-        return int(f.read().strip())
-    
-def bump_next_id():
-    """Increment counter by 1 and continue"""
-    next_id = get_next_id() + 1
-    with open(COUNTER_PATH, "w") as f:
-        f.write(str(next_id))
+        # ids are AUTOINCREMENT, so anything above the current max was inserted by this import
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM applications").fetchone()[0]
+        conn.execute(sql_dedupe)
+        conn.execute(sql_intern.format(table="companies", column="company")).fetchall()
+        _index_roles(conn, [r[0] for r in conn.execute(sql_intern.format(table="roles", column="role"))])
+        changed = conn.execute(sql, (user_id,)).rowcount
+        inserted = conn.execute("SELECT COUNT(*) FROM applications WHERE id > ?", (max_id,)).fetchone()[0]
+        conn.execute("DELETE FROM import_stage")
 
-    return next_id
-    
-def add_application(company: str, role: str, date_applied: dt.date|str, status: str):
-    company_input = company
-    role_input = role
-    date_applied_input = date_applied
-    status_input = status
-
-    if company != None and  role != None and date_applied != None and status in {"Applied", "OA", "Interview", "Offer", "Rejected"}:
-        sql = """
-            INSERT INTO applications
-            (company, role, date_applied, status)
-            VALUES (?, ?, ?, ?)
-            """
+    return {"inserted": inserted, "updated": changed - inserted, "skipped": staged - changed,
+            "batches": n_batches}
 
-        with get_connection() as conn:
-            cur = conn.execute(sql, (company_input, role_input, date_applied_input, status_input))
-            row_id = cur.lastrowid
 
-    return row_id
+@timed
+def bulk_insert_applications(rows, on_conflict="update", user_id=DEFAULT_USER):
+    if rows is None or rows == []:
+        return 0
+
+    return import_batches([rows], on_conflict=on_conflict, user_id=user_id)["inserted"]
 
 
-def update_status(app_id: int, new_status: str):
+@timed
+def update_status(app_id: int, new_status: str, user_id=DEFAULT_USER):
+    # trg_events_update logs the change to status_events in this same transaction
     sql = """
         UPDATE applications
         SET status = ?
-        WHERE id = ?
+        WHERE id = ? AND user_id = ?
         """
     
     with get_connection() as conn:
-        conn.execute(sql, (new_status, app_id))
+        conn.execute(sql, (status_code(new_status), app_id, user_id))
     
     return
 
 
-def delete_application(app_id: int):
+@timed
+def delete_application(app_id: int, user_id=DEFAULT_USER):
     sql = """
         DELETE FROM applications
-        WHERE id = ?
+        WHERE id = ? AND user_id = ?
         """
     
     with get_connection() as conn:
-        conn.execute(sql, (app_id,))
+        conn.execute(sql, (app_id, user_id))
 
     return
 
-def delete_all_apps():
+@timed
+def apply_batch(updates=(), deletes=(), user_id=DEFAULT_USER):
+    """
+    Apply edits from the data editor in one transaction: one executemany UPDATE for the
+    status changes and one DELETE ... WHERE id IN (...) for the deletes.
+    updates: iterable of (app_id, new_status), deletes: iterable of app_id.
+    A row that is both edited and deleted is just deleted, ids of other users' rows are 'missing'.
+    Returns {app_id: 'updated' | 'deleted' | 'missing' | 'invalid status'}
+    """
+    delete_ids = {int(app_id) for app_id in deletes}
+    new_status = {int(app_id): status for app_id, status in updates if int(app_id) not in delete_ids}
+
+    results = {app_id: "invalid status" for app_id, status in new_status.items() if status not in STATUSES}
+    new_status = {app_id: status for app_id, status in new_status.items() if app_id not in results}
+
+    touched = list(delete_ids | new_status.keys())
+    if not touched:
+        return results
+
+    # ids go in as one json array parameter, so there's no limit on how many
+    sql_existing = "SELECT id FROM applications WHERE id IN (SELECT value FROM json_each(?)) AND user_id = ?"
+    sql_update = "UPDATE applications SET status = ? WHERE id = ? AND user_id = ? AND status IS NOT ?"
+    sql_delete = "DELETE FROM applications WHERE id IN (SELECT value FROM json_each(?)) AND user_id = ?"
+
+    with get_connection() as conn:
+        existing = {r[0] for r in conn.execute(sql_existing, (json.dumps(touched), user_id))}
+
+        conn.executemany(sql_update, [(status_code(status), app_id, user_id, status_code(status))
+                                      for app_id, status in new_status.items() if app_id in existing])
+        conn.execute(sql_delete, (json.dumps([app_id for app_id in delete_ids if app_id in existing]), user_id))
+
+    for app_id in new_status:
+        results[app_id] = "updated" if app_id in existing else "missing"
+    for app_id in delete_ids:
+        results[app_id] = "deleted" if app_id in existing else "missing"
+
+    return results
+
+
+@timed
+def delete_all_apps(user_id=DEFAULT_USER):
     sql = """
-        DELETE FROM applications;
+        DELETE FROM applications WHERE user_id = ?;
         """
     
     with get_connection() as conn:
-        conn.execute(sql)
+        conn.execute(sql, (user_id,))
 
     return
 
-def list_applications_df(limit=100, status=None, date_start=None, date_end=None, company_substr=None, role_substr=None):
-    sql = """
-        SELECT id, company, role, date_applied, status
-        FROM applications
-        """
+# counter tables of the users in (:to, :from), rebuilt from applications (see claim_rows)
+_SQL_RECOUNT_USERS = (
+    "DELETE FROM stats WHERE user_id IN (:to, :from)",
+    """INSERT INTO stats (user_id, scope, key, n)
+       SELECT user_id, 'total', '', COUNT(*) FROM applications
+       WHERE user_id IN (:to, :from) GROUP BY user_id
+       UNION ALL
+       SELECT a.user_id, 'status', s.name, COUNT(*) FROM applications AS a JOIN statuses AS s ON s.code = a.status
+       WHERE a.user_id IN (:to, :from) GROUP BY a.user_id, a.status""",
+    "DELETE FROM daily_rollup WHERE user_id IN (:to, :from)",
+    """INSERT INTO daily_rollup (user_id, day, status, n)
+       SELECT a.user_id, date(a.day * 86400, 'unixepoch'), s.name, COUNT(*)
+       FROM applications AS a JOIN statuses AS s ON s.code = a.status
+       WHERE a.user_id IN (:to, :from) GROUP BY a.user_id, a.day, a.status""",
+    "DELETE FROM role_counts WHERE user_id IN (:to, :from)",
+    """INSERT INTO role_counts (user_id, role, n)
+       SELECT a.user_id, r.name, COUNT(*) FROM applications AS a JOIN roles AS r ON r.id = a.role_id
+       WHERE a.user_id IN (:to, :from) GROUP BY a.user_id, a.role_id""",
+    "DELETE FROM company_counts WHERE user_id IN (:to, :from)",
+    """INSERT INTO company_counts (user_id, company, n)
+       SELECT a.user_id, c.name, COUNT(*) FROM applications AS a JOIN companies AS c ON c.id = a.company_id
+       WHERE a.user_id IN (:to, :from) GROUP BY a.user_id, a.company_id""",
+)
+
+
+@timed
+def claim_rows(user_id, from_user=DEFAULT_USER):
+    """
+    Hand from_user's applications and their status_events over to user_id. By default these are
+    the rows without an owner: migration 9 gave every row from before logins user_id ''.
+    A row whose (company, role, date_applied) user_id already has stays with from_user.
+    The counter triggers don't follow user_id, so both users' counters are recounted.
+    Returns {'moved', 'left'}.
+    """
+    sql_move = """
+        UPDATE applications SET user_id = :to
+        WHERE user_id = :from AND NOT EXISTS (
+            SELECT 1 FROM applications AS b
+            WHERE b.user_id = :to AND b.company_id = applications.company_id
+              AND b.role_id = applications.role_id AND b.day = applications.day
+        )"""
+    sql_events = """
+        UPDATE status_events SET user_id = :to
+        WHERE user_id = :from AND app_id IN (SELECT id FROM applications WHERE user_id = :to)"""
+
+    params = {"to": user_id, "from": from_user}
+    with get_connection() as conn:
+        # the common case, nothing to claim, stays a read
+        if conn.execute("SELECT 1 FROM applications WHERE user_id = ? LIMIT 1", (from_user,)).fetchone() is None:
+            return {"moved": 0, "left": 0}
+
+        moved = conn.execute(sql_move, params).rowcount
+        if moved:
+            conn.execute(sql_events, params)
+            for sql in _SQL_RECOUNT_USERS:
+                conn.execute(sql, params)
+        left = conn.execute("SELECT COUNT(*) FROM applications WHERE user_id = ?", (from_user,)).fetchone()[0]
+
+    return {"moved": moved, "left": left}
+
+
+def frame_from_rows(rows, names):
+    """
+    Build a DataFrame column by column from plain tuples (no dict per row).
+    Known columns get their final dtypes here so nothing downstream re-parses strings:
+    id -> int64, status -> Categorical(STATUSES), date_applied -> datetime64[ns].
+    status and date_applied can come as stored (code and day number) or as text.
+    Index starts at 1 like the table shows it.
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    data = {}
+
+    for name, values in zip(names, columns):
+        stored = bool(values) and isinstance(values[0], int)
+        if name == "id":
+            data[name] = np.fromiter(values, dtype=np.int64, count=len(values))
+        elif name == "status" and stored:
+            data[name] = pd.Categorical.from_codes(np.fromiter(values, dtype=np.int8, count=len(values)),
+                                                   dtype=STATUS_DTYPE)
+        elif name == "status":
+            data[name] = pd.Categorical(values, dtype=STATUS_DTYPE)
+        elif name == "date_applied" and stored:
+            days = np.fromiter(values, dtype=np.int64, count=len(values)).astype("datetime64[D]")
+            data[name] = pd.DatetimeIndex(days.astype("datetime64[ns]"))
+        elif name == "date_applied":
+            data[name] = pd.to_datetime(pd.Index(values, dtype=object), format="ISO8601", errors="coerce").as_unit("ns")
+        else:
+            data[name] = np.array(values, dtype=object)
+
+    return pd.DataFrame(data, index=pd.RangeIndex(1, len(rows) + 1))
+
+
+def frame_from_cursor(cur):
+    """Fetch everything from an executed cursor as plain tuples and build the frame with frame_from_rows"""
+    cur.row_factory = None
+    rows = cur.fetchall()
+    return frame_from_rows(rows, [d[0] for d in cur.description])
+
+
+# ids of one user's company/role names that contain a pattern, from that user's counter rows
+_SQL_USER_NAMES_LIKE = """a.{column}_id IN (
+    SELECT d.id FROM {column}_counts AS cc JOIN {table} AS d ON d.name = cc.{column}
+    WHERE cc.user_id = ? AND cc.n > 0 AND LOWER(cc.{column}) LIKE LOWER(?))"""
+
+
+def _only_user(conn, user_id):
+    # True when applications holds no other user's rows, two seeks on idx_applications_user
+    return conn.execute(
+        "SELECT COALESCE((SELECT MIN(user_id) FROM applications) = ? AND (SELECT MAX(user_id) FROM applications) = ?, 1)",
+        (user_id, user_id)).fetchone()[0] == 1
+
+
+def _filter_sql(conn, user_id=DEFAULT_USER, status=None, date_start=None, date_end=None, company_substr=None, role_substr=None):
+    """
+    Shared WHERE builder for the applications listings (table alias `a`), always scoped to user_id.
+    Filters take dates and status names, they are compared as day numbers and codes.
+    Returns (source, clauses, params, searching), source being what goes after FROM.
+    Company/role "contains" filters go through the trigram index when it exists and every row
+    belongs to user_id, `searching` is True when it is joined as `f`. The index covers all
+    users, so with several users they run LIKE over the user's own names instead (from
+    company_counts/role_counts), and the cost only depends on that user's data.
+    """
     clauses = []
     params = []
+    match = []
+    use_fts = _fts_enabled(conn) and _only_user(conn, user_id)
+
+    # every index on applications leads with user_id
+    clauses.append("a.user_id = ?"); params.append(user_id)
 
     if status:
-        clauses.append("status = ?"); params.append(status)
+        clauses.append("a.status = ?"); params.append(status_code(status))
 
     if date_start:
-        clauses.append("date_applied >= ?"); params.append(date_start)
-    
+        clauses.append("a.day >= ?"); params.append(day_number(date_start))
+
     if date_end:
-        clauses.append("date_applied <= ?"); params.append(date_end)
+        clauses.append("a.day <= ?"); params.append(day_number(date_end))
 
+    # without the index, LIKE runs over the user's distinct names once instead of once per row
     if company_substr:
-        clauses.append("LOWER(company) LIKE LOWER(?)"); params.append(f"%{company_substr}%")
+        if use_fts and len(company_substr) >= FTS_MIN_CHARS:
+            match.append(_fts_phrase("company", company_substr))
+        else:
+            clauses.append(_SQL_USER_NAMES_LIKE.format(column="company", table="companies"))
+            params.extend([user_id, f"%{company_substr}%"])
 
     if role_substr:
-        clauses.append("LOWER(role) LIKE LOWER(?)"); params.append(f"%{role_substr}%")
-    
-    if clauses:
-        sql = f"{sql} WHERE " + " AND ".join(clauses)
-    else:
-        sql = sql
-
-    sql += " ORDER BY id ASC LIMIT ?"
-    params.append(limit)
+        if use_fts and len(role_substr) >= FTS_MIN_CHARS:
+            match.append(_fts_phrase("role", role_substr))
+        else:
+            clauses.append(_SQL_USER_NAMES_LIKE.format(column="role", table="roles"))
+            params.extend([user_id, f"%{role_substr}%"])
+
+    source = "applications AS a"
+    if match:
+        # CROSS JOIN keeps the index as the outer loop: the other way round sqlite reruns
+        # the MATCH for every application the date/status index lets through
+        source = "applications_fts AS f CROSS JOIN applications AS a"
+        clauses.insert(0, "applications_fts MATCH ? AND a.id = f.rowid"); params.insert(0, " AND ".join(match))
+
+    return source, clauses, params, bool(match)
+
+
+@cached
+@timed
+def list_applications_df(limit=100, status=None, date_start=None, date_end=None, company_substr=None, role_substr=None,
+                         user_id=DEFAULT_USER):
+    """
+    When searching company/role through the trigram index (see _filter_sql), the best bm25
+    matches come first, otherwise rows are ordered by id.
+    """
+    sql = """
+        SELECT a.id, c.name AS company, r.name AS role, a.day AS date_applied, a.status
+        FROM {source}
+        JOIN companies AS c ON c.id = a.company_id
+        JOIN roles AS r ON r.id = a.role_id
+        """
 
     with get_connection() as conn:
-        rows = conn.execute(sql, params).fetchall()
-    df = pd.DataFrame([dict(r) for r in rows])
-    df.index += 1
+        source, clauses, params, searching = _filter_sql(conn, user_id, status, date_start, date_end, company_substr, role_substr)
+        sql = sql.format(source=source)
+
+        if clauses:
+            sql = f"{sql} WHERE " + " AND ".join(clauses)
+
+        sql += " ORDER BY f.rank, a.id ASC LIMIT ?" if searching else " ORDER BY a.id ASC LIMIT ?"
+        params.append(limit)
 
+        cur = conn.execute(sql, params)
+        df = frame_from_cursor(cur)
 
     return df
 
-    
 
+@cached
+@timed
+def list_applications_page(page_size=100, after=None, status=None, date_start=None, date_end=None, company_substr=None, role_substr=None,
+                           user_id=DEFAULT_USER):
+    """
+    One page of applications, newest first.
+    Keyset pagination on (day, id) so every page is an index seek, no OFFSET.
+    `after` is the cursor returned for the previous page (None for the first page).
+    Returns (df, next_after), next_after is None on the last page.
+    """
+    sql = """
+        SELECT a.id, c.name AS company, r.name AS role, a.day AS date_applied, a.status
+        FROM {source}
+        JOIN companies AS c ON c.id = a.company_id
+        JOIN roles AS r ON r.id = a.role_id
+        """
 
+    with get_connection() as conn:
+        source, clauses, params, _ = _filter_sql(conn, user_id, status, date_start, date_end, company_substr, role_substr)
+        sql = sql.format(source=source)
 
+        if after is not None:
+            clauses.append("(a.day, a.id) < (?, ?)"); params.extend(after)
 
+        if clauses:
+            sql = f"{sql} WHERE " + " AND ".join(clauses)
+
+        # one extra row tells us whether there is a next page
+        sql += " ORDER BY a.day DESC, a.id DESC LIMIT ?"
+        params.append(page_size + 1)
+
+        cur = conn.execute(sql, params)
+        cur.row_factory = None
+        rows = cur.fetchall()
+        names = [d[0] for d in cur.description]
+
+    next_after = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_after = (rows[-1][3], rows[-1][0])
+
+    return frame_from_rows(rows, names), next_after
+
+
+def iter_applications_df(chunk_size=1000, **filters):
+    """
+    Yield the filtered applications as DataFrame chunks of at most chunk_size rows, newest first.
+    Takes the same filters (and user_id) as list_applications_page.
+    """
+    # bypass the result cache, a full scan shouldn't evict everything else
+    read_page = list_applications_page.__wrapped__
+
+    after = None
+    while True:
+        df, after = read_page(page_size=chunk_size, after=after, **filters)
+        if not df.empty:
+            yield df
+        if after is None:
+            return
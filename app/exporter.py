@@ -0,0 +1,96 @@
+"""
+Streaming export of the filtered applications.
+Rows are read from the database in keyset pages (db.iter_applications_df) and written to the
+output one chunk at a time, so an export never builds the whole table as a DataFrame.
+CSV always works, Parquet needs pyarrow.
+"""
+import io
+
+import numpy as np
+
+from db import STATUSES, DEFAULT_USER, iter_applications_df
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+CHUNK_ROWS = 50_000
+FIELDS = ["id", "company", "role", "date_applied", "status"]
+
+FORMATS = {
+    "csv": ("text/csv", "applications.csv"),
+    "parquet": ("application/vnd.apache.parquet", "applications.parquet"),
+}
+
+
+def available_formats():
+    """Export formats that work with what is installed"""
+    return [f for f in FORMATS if f != "parquet" or pq is not None]
+
+
+def _csv_chunk(df):
+    df = df[FIELDS].copy()
+    df["date_applied"] = np.datetime_as_string(df["date_applied"].to_numpy(dtype="datetime64[D]"), unit="D")
+    return df.to_csv(index=False, header=False).encode("utf-8")
+
+
+def write_csv(out, chunk_size=CHUNK_ROWS, user_id=DEFAULT_USER, **filters):
+    """Write the filtered applications to the binary file out as CSV with a header. Returns the row count"""
+    n = 0
+    out.write((",".join(FIELDS) + "\n").encode("utf-8"))
+    for df in iter_applications_df(chunk_size=chunk_size, user_id=user_id, **filters):
+        out.write(_csv_chunk(df))
+        n += len(df)
+    return n
+
+
+def _parquet_schema():
+    return pa.schema([
+        ("id", pa.int64()),
+        ("company", pa.string()),
+        ("role", pa.string()),
+        ("date_applied", pa.date32()),
+        ("status", pa.dictionary(pa.int8(), pa.string())),
+    ])
+
+
+def _parquet_chunk(df, schema):
+    codes = df["status"].cat.codes.to_numpy(dtype=np.int8)
+    return pa.record_batch([
+        pa.array(df["id"].to_numpy(), pa.int64()),
+        pa.array(df["company"].to_numpy(), pa.string()),
+        pa.array(df["role"].to_numpy(), pa.string()),
+        pa.array(df["date_applied"].to_numpy(dtype="datetime64[D]"), pa.date32()),
+        # every chunk shares the STATUSES dictionary, -1 (no status) becomes null
+        pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0), pa.array(STATUSES, pa.string())),
+    ], schema=schema)
+
+
+def write_parquet(out, chunk_size=CHUNK_ROWS, user_id=DEFAULT_USER, **filters):
+    """Write the filtered applications to the binary file out as Parquet, one row group per chunk. Returns the row count"""
+    if pq is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    schema = _parquet_schema()
+    n = 0
+    with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+        for df in iter_applications_df(chunk_size=chunk_size, user_id=user_id, **filters):
+            writer.write_batch(_parquet_chunk(df, schema))
+            n += len(df)
+    return n
+
+
+def export_bytes(fmt, user_id=DEFAULT_USER, **filters):
+    """
+    The whole export as one file object, rewound to the start.
+    Made to be wrapped in a lambda for st.download_button(data=...), which only calls it on click.
+    """
+    out = io.BytesIO()
+    if fmt == "parquet":
+        write_parquet(out, user_id=user_id, **filters)
+    else:
+        write_csv(out, user_id=user_id, **filters)
+    out.seek(0)
+    return out
@@ -0,0 +1,202 @@
+"""
+Streaming CSV import.
+Encoding and delimiter are detected once from a small sample, and so is the date format (every
+chunk has to parse dates the same way). The file is then read in chunks with pandas' C parser,
+each chunk is normalized with vectorized pandas and all chunks are upserted in a single transaction.
+"""
+import csv
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+from db import STATUSES, DEFAULT_USER, import_batches
+
+ENCODINGS = ["utf-8", "cp1252", "latin1"]
+SAMPLE_BYTES = 64 * 1024
+DATE_SAMPLE_ROWS = 1000
+CHUNK_ROWS = 50_000
+DELIMITERS = ",;\t|"
+
+FIELDS = ["company", "role", "date_applied", "status"]
+
+# lower-cased CSV status -> allowed status
+STATUS_ALIASES = {
+    **{s.lower(): s for s in STATUSES},
+    "submitted": "Applied",
+    "online assessment": "OA",
+    "assessment": "OA",
+    "phone screen": "Interview",
+    "onsite": "Interview",
+    "offer accepted": "Offer",
+    "declined": "Rejected",
+}
+
+
+def _file_size(file):
+    pos = file.tell()
+    file.seek(0, 2)
+    size = file.tell()
+    file.seek(pos)
+    return size
+
+
+def sniff_csv(file, sample_bytes=SAMPLE_BYTES):
+    """
+    Detect (encoding, delimiter) from the first sample_bytes of an uploaded (binary) file.
+    Falls back to latin1 and "," when nothing better fits.
+    """
+    file.seek(0)
+    sample = file.read(sample_bytes)
+    file.seek(0)
+
+    # don't let a character cut in half at the end of the sample look like a decode error
+    if len(sample) == sample_bytes and b"\n" in sample:
+        sample = sample[:sample.rfind(b"\n") + 1]
+
+    if sample.startswith(b"\xef\xbb\xbf"):
+        encoding, text = "utf-8-sig", sample.decode("utf-8-sig", errors="replace")
+    else:
+        encoding, text = "latin1", sample.decode("latin1")
+        for enc in ENCODINGS:
+            try:
+                text = sample.decode(enc)
+                encoding = enc
+                break
+            except UnicodeDecodeError:
+                continue
+
+    try:
+        delimiter = csv.Sniffer().sniff(text, delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = ","
+
+    return encoding, delimiter
+
+
+def preview_csv(file, encoding, delimiter, nrows=10):
+    """First nrows of the file, for the column mapping dialog"""
+    file.seek(0)
+    df = pd.read_csv(file, encoding=encoding, sep=delimiter, engine="c", nrows=nrows,
+                     encoding_errors="replace")
+    file.seek(0)
+    return df
+
+
+def date_formats(file, encoding, delimiter, column, nrows=DATE_SAMPLE_ROWS):
+    """
+    Candidate formats for the date column, guessed from its first nrows values, best first
+    (most sample values parsed; on a tie month-first before day-first, like pandas).
+    Empty when no format could be guessed, import_csv then parses each value on its own ("mixed").
+    """
+    file.seek(0)
+    sample = pd.read_csv(file, encoding=encoding, sep=delimiter, engine="c", usecols=[column], dtype=str,
+                         nrows=nrows, encoding_errors="replace")[column].str.strip().dropna()
+    file.seek(0)
+
+    # dict keeps first-seen order, so ties go to the month-first guess
+    # (pandas warns when a month-first guess comes back day-first, which is what we're asking for here)
+    candidates = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        for value in sample.unique()[:50]:
+            for dayfirst in (False, True):
+                fmt = guess_datetime_format(value, dayfirst=dayfirst)
+                if fmt is not None:
+                    candidates.setdefault(fmt, None)
+
+    parsed = {fmt: int(pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum()) for fmt in candidates}
+    return sorted((fmt for fmt in parsed if parsed[fmt]), key=lambda fmt: -parsed[fmt])
+
+
+def read_csv_chunks(file, encoding, delimiter, columns=None, chunksize=CHUNK_ROWS):
+    """Iterate the file as DataFrame chunks of raw strings, only parsing the given columns"""
+    file.seek(0)
+    return pd.read_csv(file, encoding=encoding, sep=delimiter, engine="c", usecols=columns,
+                       dtype=str, chunksize=chunksize, encoding_errors="replace")
+
+
+def check_mapping(mapping, columns):
+    """Return a list of problems with the user's column choices (empty when it is usable)"""
+    problems = []
+    picks = [mapping[f] for f in FIELDS]
+
+    if len(set(picks)) < len(FIELDS):
+        problems.append("Each target field must map to a different CSV column")
+
+    missing = [c for c in picks if c not in columns]
+    if missing:
+        problems.append(f"Selected column(s) not found in CSV: {missing}")
+
+    return problems
+
+
+def apply_user_mapping(df_raw: pd.DataFrame, user_choice: dict[str, str], date_format="mixed"):
+    """
+    Input:
+    - df_raw: one chunk of the uploaded csv
+    - user_choice: keys are our fields (company, role, date_applied, status), values are the csv columns
+    - date_format: strftime format of the date column (see date_formats), "mixed" parses each value on its own
+
+    Output: (out, invalid, unknown)
+    - out: company, role, date_applied (ISO string) and status, only rows that can be inserted
+    - invalid: number of rows dropped (missing company/role, bad date or unknown status)
+    - unknown: set of status values we couldn't map
+    """
+    company = df_raw[user_choice["company"]].str.strip()
+    role = df_raw[user_choice["role"]].str.strip()
+    raw_status = df_raw[user_choice["status"]].str.strip()
+    status = raw_status.str.lower().map(STATUS_ALIASES)
+    dates = pd.to_datetime(df_raw[user_choice["date_applied"]].str.strip(), format=date_format,
+                           errors="coerce")
+
+    valid = (company.notna() & (company != "") & role.notna() & (role != "")
+             & dates.notna() & status.notna())
+
+    unknown = set(raw_status[status.isna() & raw_status.notna()].unique().tolist())
+
+    out = pd.DataFrame({
+        "company": company[valid],
+        "role": role[valid],
+        "date_applied": np.datetime_as_string(dates[valid].to_numpy(dtype="datetime64[D]"), unit="D"),
+        "status": status[valid],
+    })
+
+    return out, int((~valid).sum()), unknown
+
+
+def import_csv(file, mapping, encoding, delimiter, on_conflict="update", chunksize=CHUNK_ROWS, progress=None,
+               user_id=DEFAULT_USER, date_format=None):
+    """
+    Import the whole file into user_id's applications in one transaction, upserting on (company, role, date_applied)
+    (see db.import_batches for on_conflict).
+    Dates are parsed with date_format, or the best of date_formats() when it isn't given.
+    progress(rows_done, fraction, rows_per_sec) is called after every chunk.
+    Returns {'rows', 'invalid', 'unknown', 'inserted', 'updated', 'skipped', 'batches', 'seconds'}
+    where invalid counts rows dropped before insert and skipped counts rows that were already there.
+    """
+    size = _file_size(file) or 1
+    report = {"rows": 0, "invalid": 0, "unknown": set()}
+    t0 = time.perf_counter()
+
+    if date_format is None:
+        date_format = next(iter(date_formats(file, encoding, delimiter, mapping["date_applied"])), "mixed")
+
+    def batches():
+        for chunk in read_csv_chunks(file, encoding, delimiter, list(set(mapping.values())), chunksize):
+            out, invalid, unknown = apply_user_mapping(chunk, mapping, date_format)
+            report["rows"] += len(chunk)
+            report["invalid"] += invalid
+            report["unknown"] |= unknown
+            yield list(zip(*(out[f].tolist() for f in FIELDS)))
+
+    def on_batch(done):
+        if progress is not None:
+            elapsed = time.perf_counter() - t0
+            progress(done, min(file.tell() / size, 1.0), done / elapsed if elapsed else 0.0)
+
+    report.update(import_batches(batches(), on_conflict=on_conflict, progress=on_batch, user_id=user_id))
+    report["seconds"] = time.perf_counter() - t0
+    return report
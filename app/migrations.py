@@ -0,0 +1,864 @@
+"""
+Schema migrations.
+MIGRATIONS is the schema's history: step i takes a database from version i to i + 1, and the
+version a database is at lives in PRAGMA user_version. migrate() applies whatever steps are
+missing, each one in its own write transaction together with its user_version bump, so
+processes starting on the same file at once apply every step exactly once between them.
+
+To change the schema append a step, never edit one that has shipped. Databases made before
+migrations existed are at version 0 whatever tables they already have, so every step has to be
+safe to run over an existing table: IF NOT EXISTS, drop-and-create triggers, recount derived tables.
+"""
+import logging
+import sqlite3
+
+logger = logging.getLogger("jobtracker.migrations")
+
+MIGRATIONS = [
+    # 1: applications, and meta for data_version (bumped by every write, see db.data_version)
+    """
+    CREATE TABLE IF NOT EXISTS applications (
+        id  INTEGER PRIMARY KEY AUTOINCREMENT,
+        company TEXT    NOT NULL,
+        role    TEXT    NOT NULL,
+        date_applied    TEXT    NOT NULL,
+        status  TEXT    NOT NULL,
+        CONSTRAINT  status_allowed  CHECK   (status IN (
+            'Applied', 'OA', 'Interview', 'Offer', 'Rejected'
+            ))
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_applications_status_date ON applications(status, date_applied);
+
+    CREATE TABLE IF NOT EXISTS meta (
+        key     TEXT    PRIMARY KEY,
+        value   INTEGER NOT NULL
+    );
+
+    INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0);
+    """,
+
+    # 2: one row per (company, role, date_applied) so re-imports update instead of duplicating.
+    # company is its leading column, so it also serves company lookups. Older databases can
+    # hold duplicates, the newest row (highest id) of each is kept.
+    # idx_applications_date is ordered by (date_applied, rowid), the keyset used for paging
+    """
+    DELETE FROM applications
+    WHERE id NOT IN (
+        SELECT MAX(id) FROM applications GROUP BY company, role, date_applied
+    );
+
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_applications_natural_key ON applications(company, role, date_applied);
+    DROP INDEX IF EXISTS idx_applications_company;
+
+    CREATE INDEX IF NOT EXISTS idx_applications_date ON applications(date_applied);
+    """,
+
+    # 3: stats holds running counts so the Analytics header never has to scan applications.
+    # scope is 'total' (key '') or 'status' (key = status)
+    """
+    CREATE TABLE IF NOT EXISTS stats (
+        scope   TEXT    NOT NULL,
+        key     TEXT    NOT NULL,
+        n       INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, key)
+    ) WITHOUT ROWID;
+
+    DROP TRIGGER IF EXISTS trg_stats_insert;
+    DROP TRIGGER IF EXISTS trg_stats_delete;
+    DROP TRIGGER IF EXISTS trg_stats_update;
+
+    CREATE TRIGGER trg_stats_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO stats (scope, key, n)
+        VALUES ('total', '', 1), ('status', NEW.status, 1)
+        ON CONFLICT (scope, key) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_stats_delete AFTER DELETE ON applications
+    BEGIN
+        UPDATE stats SET n = n - 1
+        WHERE (scope = 'total' AND key = '')
+           OR (scope = 'status' AND key = OLD.status);
+    END;
+
+    CREATE TRIGGER trg_stats_update AFTER UPDATE OF status ON applications
+    BEGIN
+        UPDATE stats SET n = n - 1 WHERE scope = 'status' AND key = OLD.status;
+        INSERT INTO stats (scope, key, n) VALUES ('status', NEW.status, 1)
+        ON CONFLICT (scope, key) DO UPDATE SET n = n + 1;
+    END;
+
+    DELETE FROM stats;
+    INSERT INTO stats (scope, key, n)
+    SELECT 'total', '', COUNT(*) FROM applications
+    UNION ALL
+    SELECT 'status', status, COUNT(*) FROM applications GROUP BY status;
+    """,
+
+    # 4: applications per (day, status), so the weekly and calendar charts cost one row per day
+    """
+    CREATE TABLE IF NOT EXISTS daily_rollup (
+        day     TEXT    NOT NULL,
+        status  TEXT    NOT NULL,
+        n       INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, status)
+    ) WITHOUT ROWID;
+
+    DROP TRIGGER IF EXISTS trg_rollup_insert;
+    DROP TRIGGER IF EXISTS trg_rollup_delete;
+    DROP TRIGGER IF EXISTS trg_rollup_update;
+
+    CREATE TRIGGER trg_rollup_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO daily_rollup (day, status, n) VALUES (NEW.date_applied, NEW.status, 1)
+        ON CONFLICT (day, status) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_rollup_delete AFTER DELETE ON applications
+    BEGIN
+        UPDATE daily_rollup SET n = n - 1 WHERE day = OLD.date_applied AND status = OLD.status;
+    END;
+
+    CREATE TRIGGER trg_rollup_update AFTER UPDATE OF status, date_applied ON applications
+    BEGIN
+        UPDATE daily_rollup SET n = n - 1 WHERE day = OLD.date_applied AND status = OLD.status;
+        INSERT INTO daily_rollup (day, status, n) VALUES (NEW.date_applied, NEW.status, 1)
+        ON CONFLICT (day, status) DO UPDATE SET n = n + 1;
+    END;
+
+    DELETE FROM daily_rollup;
+    INSERT INTO daily_rollup (day, status, n)
+    SELECT date_applied, status, COUNT(*) FROM applications GROUP BY date_applied, status;
+    """,
+
+    # 5: trigram FTS5 index over company and role for "contains" filters. It is an external
+    # content table (the text stays in applications) kept in sync by triggers.
+    # Optional, see OPTIONAL_STEPS
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS applications_fts USING fts5(
+        company, role,
+        content = 'applications', content_rowid = 'id',
+        tokenize = 'trigram'
+    );
+
+    DROP TRIGGER IF EXISTS trg_fts_insert;
+    DROP TRIGGER IF EXISTS trg_fts_delete;
+    DROP TRIGGER IF EXISTS trg_fts_update;
+
+    CREATE TRIGGER trg_fts_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO applications_fts (rowid, company, role) VALUES (NEW.id, NEW.company, NEW.role);
+    END;
+
+    CREATE TRIGGER trg_fts_delete AFTER DELETE ON applications
+    BEGIN
+        INSERT INTO applications_fts (applications_fts, rowid, company, role)
+        VALUES ('delete', OLD.id, OLD.company, OLD.role);
+    END;
+
+    CREATE TRIGGER trg_fts_update AFTER UPDATE OF company, role ON applications
+    BEGIN
+        INSERT INTO applications_fts (applications_fts, rowid, company, role)
+        VALUES ('delete', OLD.id, OLD.company, OLD.role);
+        INSERT INTO applications_fts (rowid, company, role) VALUES (NEW.id, NEW.company, NEW.role);
+    END;
+
+    INSERT INTO applications_fts (applications_fts) VALUES ('rebuild');
+    """,
+
+    # 6: applications per distinct role, role_terms holds each role's n-grams (filled by db.py
+    # when a role title is first stored)
+    """
+    CREATE TABLE IF NOT EXISTS role_counts (
+        role    TEXT    PRIMARY KEY,
+        n       INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS role_terms (
+        role    TEXT    NOT NULL,
+        term    TEXT    NOT NULL,
+        words   INTEGER NOT NULL,
+        cnt     INTEGER NOT NULL,
+        PRIMARY KEY (role, term)
+    ) WITHOUT ROWID;
+
+    DROP TRIGGER IF EXISTS trg_roles_insert;
+    DROP TRIGGER IF EXISTS trg_roles_delete;
+    DROP TRIGGER IF EXISTS trg_roles_update;
+
+    CREATE TRIGGER trg_roles_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO role_counts (role, n) VALUES (NEW.role, 1)
+        ON CONFLICT (role) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_roles_delete AFTER DELETE ON applications
+    BEGIN
+        UPDATE role_counts SET n = n - 1 WHERE role = OLD.role;
+    END;
+
+    CREATE TRIGGER trg_roles_update AFTER UPDATE OF role ON applications
+    BEGIN
+        UPDATE role_counts SET n = n - 1 WHERE role = OLD.role;
+        INSERT INTO role_counts (role, n) VALUES (NEW.role, 1)
+        ON CONFLICT (role) DO UPDATE SET n = n + 1;
+    END;
+
+    DELETE FROM role_terms;
+    DELETE FROM role_counts;
+    INSERT INTO role_counts (role, n)
+    SELECT role, COUNT(*) FROM applications GROUP BY role;
+    """,
+
+    # 7: applications per company, for top_k without a date/status filter
+    """
+    CREATE TABLE IF NOT EXISTS company_counts (
+        company TEXT    PRIMARY KEY,
+        n       INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_company_counts_n ON company_counts(n);
+
+    DROP TRIGGER IF EXISTS trg_companies_insert;
+    DROP TRIGGER IF EXISTS trg_companies_delete;
+    DROP TRIGGER IF EXISTS trg_companies_update;
+
+    CREATE TRIGGER trg_companies_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO company_counts (company, n) VALUES (NEW.company, 1)
+        ON CONFLICT (company) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_companies_delete AFTER DELETE ON applications
+    BEGIN
+        UPDATE company_counts SET n = n - 1 WHERE company = OLD.company;
+    END;
+
+    CREATE TRIGGER trg_companies_update AFTER UPDATE OF company ON applications
+    BEGIN
+        UPDATE company_counts SET n = n - 1 WHERE company = OLD.company;
+        INSERT INTO company_counts (company, n) VALUES (NEW.company, 1)
+        ON CONFLICT (company) DO UPDATE SET n = n + 1;
+    END;
+
+    DELETE FROM company_counts;
+    INSERT INTO company_counts (company, n)
+    SELECT company, COUNT(*) FROM applications GROUP BY company;
+    """,
+
+    # 8: append-only log of every status an application has had, written by triggers in the
+    # same transaction as the insert/update (imports included, their upserts are updates).
+    # at is when the tracker learned of it (UTC); rows that predate the log get one event
+    # at their date_applied
+    """
+    CREATE TABLE IF NOT EXISTS status_events (
+        id      INTEGER PRIMARY KEY,
+        app_id  INTEGER NOT NULL REFERENCES applications(id) ON DELETE CASCADE,
+        status  TEXT    NOT NULL,
+        at      TEXT    NOT NULL
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_status_events_app ON status_events(app_id, at);
+
+    DROP TRIGGER IF EXISTS trg_events_insert;
+    DROP TRIGGER IF EXISTS trg_events_update;
+
+    CREATE TRIGGER trg_events_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO status_events (app_id, status, at)
+        VALUES (NEW.id, NEW.status, strftime('%Y-%m-%d %H:%M:%S', 'now'));
+    END;
+
+    CREATE TRIGGER trg_events_update AFTER UPDATE OF status ON applications
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+        INSERT INTO status_events (app_id, status, at)
+        VALUES (NEW.id, NEW.status, strftime('%Y-%m-%d %H:%M:%S', 'now'));
+    END;
+
+    DELETE FROM status_events;
+    INSERT INTO status_events (app_id, status, at)
+    SELECT id, status, date_applied FROM applications;
+    """,
+
+    # 9: per-user data. applications.user_id is the authenticated username ('' for a single-user
+    # install and for rows from before this step) and leads every index and every counter
+    # table's key, so one user's reads never walk another user's rows. Counter tables are
+    # rebuilt with the new key, role_terms stays shared (a role title's n-grams don't depend on
+    # who applied). status_events keeps its app_id index, the ON DELETE CASCADE lookup needs it
+    """
+    ALTER TABLE applications ADD COLUMN user_id TEXT NOT NULL DEFAULT '';
+
+    DROP INDEX IF EXISTS idx_applications_natural_key;
+    DROP INDEX IF EXISTS idx_applications_date;
+    DROP INDEX IF EXISTS idx_applications_status_date;
+    CREATE UNIQUE INDEX idx_applications_natural_key ON applications(user_id, company, role, date_applied);
+    CREATE INDEX idx_applications_date ON applications(user_id, date_applied);
+    CREATE INDEX idx_applications_status_date ON applications(user_id, status, date_applied);
+    -- (user_id, rowid) order, for a user's rows by id
+    CREATE INDEX idx_applications_user ON applications(user_id);
+
+    DROP TRIGGER IF EXISTS trg_stats_insert;
+    DROP TRIGGER IF EXISTS trg_stats_delete;
+    DROP TRIGGER IF EXISTS trg_stats_update;
+    DROP TRIGGER IF EXISTS trg_rollup_insert;
+    DROP TRIGGER IF EXISTS trg_rollup_delete;
+    DROP TRIGGER IF EXISTS trg_rollup_update;
+    DROP TRIGGER IF EXISTS trg_roles_insert;
+    DROP TRIGGER IF EXISTS trg_roles_delete;
+    DROP TRIGGER IF EXISTS trg_roles_update;
+    DROP TRIGGER IF EXISTS trg_companies_insert;
+    DROP TRIGGER IF EXISTS trg_companies_delete;
+    DROP TRIGGER IF EXISTS trg_companies_update;
+    DROP TRIGGER IF EXISTS trg_events_insert;
+    DROP TRIGGER IF EXISTS trg_events_update;
+
+    DROP TABLE IF EXISTS stats;
+    CREATE TABLE stats (
+        user_id TEXT    NOT NULL,
+        scope   TEXT    NOT NULL,
+        key     TEXT    NOT NULL,
+        n       INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, scope, key)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER trg_stats_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO stats (user_id, scope, key, n)
+        VALUES (NEW.user_id, 'total', '', 1), (NEW.user_id, 'status', NEW.status, 1)
+        ON CONFLICT (user_id, scope, key) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_stats_delete AFTER DELETE ON applications
+    BEGIN
+        UPDATE stats SET n = n - 1
+        WHERE user_id = OLD.user_id
+          AND ((scope = 'total' AND key = '') OR (scope = 'status' AND key = OLD.status));
+    END;
+
+    CREATE TRIGGER trg_stats_update AFTER UPDATE OF status ON applications
+    BEGIN
+        UPDATE stats SET n = n - 1 WHERE user_id = OLD.user_id AND scope = 'status' AND key = OLD.status;
+        INSERT INTO stats (user_id, scope, key, n) VALUES (NEW.user_id, 'status', NEW.status, 1)
+        ON CONFLICT (user_id, scope, key) DO UPDATE SET n = n + 1;
+    END;
+
+    INSERT INTO stats (user_id, scope, key, n)
+    SELECT user_id, 'total', '', COUNT(*) FROM applications GROUP BY user_id
+    UNION ALL
+    SELECT user_id, 'status', status, COUNT(*) FROM applications GROUP BY user_id, status;
+
+    DROP TABLE IF EXISTS daily_rollup;
+    CREATE TABLE daily_rollup (
+        user_id TEXT    NOT NULL,
+        day     TEXT    NOT NULL,
+        status  TEXT    NOT NULL,
+        n       INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, status)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER trg_rollup_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO daily_rollup (user_id, day, status, n) VALUES (NEW.user_id, NEW.date_applied, NEW.status, 1)
+        ON CONFLICT (user_id, day, status) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_rollup_delete AFTER DELETE ON applications
+    BEGIN
+        UPDATE daily_rollup SET n = n - 1
+        WHERE user_id = OLD.user_id AND day = OLD.date_applied AND status = OLD.status;
+    END;
+
+    CREATE TRIGGER trg_rollup_update AFTER UPDATE OF status, date_applied ON applications
+    BEGIN
+        UPDATE daily_rollup SET n = n - 1
+        WHERE user_id = OLD.user_id AND day = OLD.date_applied AND status = OLD.status;
+        INSERT INTO daily_rollup (user_id, day, status, n) VALUES (NEW.user_id, NEW.date_applied, NEW.status, 1)
+        ON CONFLICT (user_id, day, status) DO UPDATE SET n = n + 1;
+    END;
+
+    INSERT INTO daily_rollup (user_id, day, status, n)
+    SELECT user_id, date_applied, status, COUNT(*) FROM applications GROUP BY user_id, date_applied, status;
+
+    DROP TABLE IF EXISTS role_counts;
+    CREATE TABLE role_counts (
+        user_id TEXT    NOT NULL,
+        role    TEXT    NOT NULL,
+        n       INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, role)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER trg_roles_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO role_counts (user_id, role, n) VALUES (NEW.user_id, NEW.role, 1)
+        ON CONFLICT (user_id, role) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_roles_delete AFTER DELETE ON applications
+    BEGIN
+        UPDATE role_counts SET n = n - 1 WHERE user_id = OLD.user_id AND role = OLD.role;
+    END;
+
+    CREATE TRIGGER trg_roles_update AFTER UPDATE OF role ON applications
+    BEGIN
+        UPDATE role_counts SET n = n - 1 WHERE user_id = OLD.user_id AND role = OLD.role;
+        INSERT INTO role_counts (user_id, role, n) VALUES (NEW.user_id, NEW.role, 1)
+        ON CONFLICT (user_id, role) DO UPDATE SET n = n + 1;
+    END;
+
+    INSERT INTO role_counts (user_id, role, n)
+    SELECT user_id, role, COUNT(*) FROM applications GROUP BY user_id, role;
+
+    DROP TABLE IF EXISTS company_counts;
+    CREATE TABLE company_counts (
+        user_id TEXT    NOT NULL,
+        company TEXT    NOT NULL,
+        n       INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, company)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX idx_company_counts_n ON company_counts(user_id, n);
+
+    CREATE TRIGGER trg_companies_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO company_counts (user_id, company, n) VALUES (NEW.user_id, NEW.company, 1)
+        ON CONFLICT (user_id, company) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_companies_delete AFTER DELETE ON applications
+    BEGIN
+        UPDATE company_counts SET n = n - 1 WHERE user_id = OLD.user_id AND company = OLD.company;
+    END;
+
+    CREATE TRIGGER trg_companies_update AFTER UPDATE OF company ON applications
+    BEGIN
+        UPDATE company_counts SET n = n - 1 WHERE user_id = OLD.user_id AND company = OLD.company;
+        INSERT INTO company_counts (user_id, company, n) VALUES (NEW.user_id, NEW.company, 1)
+        ON CONFLICT (user_id, company) DO UPDATE SET n = n + 1;
+    END;
+
+    INSERT INTO company_counts (user_id, company, n)
+    SELECT user_id, company, COUNT(*) FROM applications GROUP BY user_id, company;
+
+    ALTER TABLE status_events ADD COLUMN user_id TEXT NOT NULL DEFAULT '';
+    UPDATE status_events SET user_id = (SELECT a.user_id FROM applications AS a WHERE a.id = app_id);
+    CREATE INDEX idx_status_events_user ON status_events(user_id, app_id, at);
+
+    CREATE TRIGGER trg_events_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO status_events (user_id, app_id, status, at)
+        VALUES (NEW.user_id, NEW.id, NEW.status, strftime('%Y-%m-%d %H:%M:%S', 'now'));
+    END;
+
+    CREATE TRIGGER trg_events_update AFTER UPDATE OF status ON applications
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+        INSERT INTO status_events (user_id, app_id, status, at)
+        VALUES (NEW.user_id, NEW.id, NEW.status, strftime('%Y-%m-%d %H:%M:%S', 'now'));
+    END;
+    """,
+
+    # 10: app_changes logs the id of every updated or deleted application, snapshot.py replays
+    # it to refresh its Arrow copy of applications. Inserts aren't logged, applications.id is
+    # AUTOINCREMENT so new rows are the ones above the last id the snapshot saw. seq is
+    # AUTOINCREMENT too, it keeps growing after snapshot.py prunes the entries it has applied
+    """
+    CREATE TABLE IF NOT EXISTS app_changes (
+        seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+        app_id  INTEGER NOT NULL
+    );
+
+    DROP TRIGGER IF EXISTS trg_changes_update;
+    DROP TRIGGER IF EXISTS trg_changes_delete;
+
+    CREATE TRIGGER trg_changes_update AFTER UPDATE ON applications
+    BEGIN
+        INSERT INTO app_changes (app_id) VALUES (OLD.id);
+    END;
+
+    CREATE TRIGGER trg_changes_delete AFTER DELETE ON applications
+    BEGIN
+        INSERT INTO app_changes (app_id) VALUES (OLD.id);
+    END;
+    """,
+
+    # 11: compact applications. Company and role names are stored once in companies/roles and
+    # referenced by id, status is its index in db.STATUSES (names in statuses) and date_applied
+    # is a day number (days since 1970-01-01), so rows and every index on them hold integers.
+    # applications_text is the old text shape, for whatever reads rows as text.
+    # The table is rebuilt with its ids and AUTOINCREMENT counter kept. status_events is copied
+    # out and back, dropping the old table would otherwise cascade-delete its events. Triggers
+    # look the names up so the counter tables and status_events keep their text keys; they
+    # and the FTS index (dropped here, rebuilt by step 12) only see names, never ids.
+    # Rows whose date_applied isn't a date (the first CSV import stored 'NaT' for dates it
+    # couldn't parse) have no day number, they are moved to applications_undated (see
+    # STEP_REPORTS). Two spellings of one date become one key, the newest row of each is kept
+    # like step 2 did, and daily_rollup is recounted on the new day numbers
+    """
+    CREATE TABLE applications_undated AS
+    SELECT id, user_id, company, role, date_applied, status FROM applications
+    WHERE strftime('%s', date_applied) IS NULL;
+
+    -- the old triggers keep the counters right, status_events of these rows cascade away
+    DELETE FROM applications
+    WHERE strftime('%s', date_applied) IS NULL
+       OR id NOT IN (
+           SELECT MAX(id) FROM applications
+           GROUP BY user_id, company, role, date(date_applied)
+       );
+
+    CREATE TABLE statuses (
+        code    INTEGER PRIMARY KEY,
+        name    TEXT    NOT NULL UNIQUE
+    );
+    INSERT INTO statuses (code, name)
+    VALUES (0, 'Applied'), (1, 'OA'), (2, 'Interview'), (3, 'Offer'), (4, 'Rejected');
+
+    -- names are never deleted, an id stays valid for good (hence no foreign keys to check)
+    CREATE TABLE companies (
+        id      INTEGER PRIMARY KEY,
+        name    TEXT    NOT NULL UNIQUE
+    );
+    CREATE TABLE roles (
+        id      INTEGER PRIMARY KEY,
+        name    TEXT    NOT NULL UNIQUE
+    );
+    INSERT INTO companies (name) SELECT DISTINCT company FROM applications ORDER BY company;
+    INSERT INTO roles (name) SELECT DISTINCT role FROM applications ORDER BY role;
+
+    DROP TABLE IF EXISTS applications_fts;
+
+    CREATE TABLE status_events_copy AS SELECT id, user_id, app_id, status, at FROM status_events;
+    DROP TABLE status_events;
+
+    CREATE TABLE applications_compact (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id     TEXT    NOT NULL DEFAULT '',
+        company_id  INTEGER NOT NULL,
+        role_id     INTEGER NOT NULL,
+        day         INTEGER NOT NULL,
+        status      INTEGER NOT NULL CHECK (status BETWEEN 0 AND 4)
+    );
+
+    -- date() drops any time of day, so the division is exact
+    INSERT INTO applications_compact (id, user_id, company_id, role_id, day, status)
+    SELECT a.id, a.user_id, c.id, r.id, CAST(strftime('%s', date(a.date_applied)) AS INTEGER) / 86400, s.code
+    FROM applications AS a
+    JOIN companies AS c ON c.name = a.company
+    JOIN roles AS r ON r.name = a.role
+    JOIN statuses AS s ON s.name = a.status
+    ORDER BY a.id;
+
+    UPDATE sqlite_sequence SET seq = MAX(seq, (SELECT seq FROM sqlite_sequence WHERE name = 'applications'))
+    WHERE name = 'applications_compact';
+    DROP TABLE applications;
+    ALTER TABLE applications_compact RENAME TO applications;
+
+    CREATE UNIQUE INDEX idx_applications_natural_key ON applications(user_id, company_id, role_id, day);
+    CREATE INDEX idx_applications_date ON applications(user_id, day);
+    CREATE INDEX idx_applications_status_date ON applications(user_id, status, day);
+    CREATE INDEX idx_applications_user ON applications(user_id);
+
+    CREATE VIEW applications_text AS
+    SELECT a.id, a.user_id, c.name AS company, r.name AS role,
+           date(a.day * 86400, 'unixepoch') AS date_applied, s.name AS status
+    FROM applications AS a
+    JOIN companies AS c ON c.id = a.company_id
+    JOIN roles AS r ON r.id = a.role_id
+    JOIN statuses AS s ON s.code = a.status;
+
+    CREATE TABLE status_events (
+        id      INTEGER PRIMARY KEY,
+        app_id  INTEGER NOT NULL REFERENCES applications(id) ON DELETE CASCADE,
+        status  TEXT    NOT NULL,
+        at      TEXT    NOT NULL,
+        user_id TEXT    NOT NULL DEFAULT ''
+    );
+    INSERT INTO status_events (id, app_id, status, at, user_id)
+    SELECT id, app_id, status, at, user_id FROM status_events_copy;
+    DROP TABLE status_events_copy;
+    CREATE INDEX idx_status_events_app ON status_events(app_id, at);
+    CREATE INDEX idx_status_events_user ON status_events(user_id, app_id, at);
+
+    DELETE FROM daily_rollup;
+    INSERT INTO daily_rollup (user_id, day, status, n)
+    SELECT a.user_id, date(a.day * 86400, 'unixepoch'), s.name, COUNT(*)
+    FROM applications AS a JOIN statuses AS s ON s.code = a.status
+    GROUP BY a.user_id, a.day, a.status;
+
+    CREATE TRIGGER trg_stats_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO stats (user_id, scope, key, n)
+        VALUES (NEW.user_id, 'total', '', 1),
+               (NEW.user_id, 'status', (SELECT name FROM statuses WHERE code = NEW.status), 1)
+        ON CONFLICT (user_id, scope, key) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_stats_delete AFTER DELETE ON applications
+    BEGIN
+        UPDATE stats SET n = n - 1
+        WHERE user_id = OLD.user_id
+          AND ((scope = 'total' AND key = '')
+               OR (scope = 'status' AND key = (SELECT name FROM statuses WHERE code = OLD.status)));
+    END;
+
+    CREATE TRIGGER trg_stats_update AFTER UPDATE OF status ON applications
+    BEGIN
+        UPDATE stats SET n = n - 1
+        WHERE user_id = OLD.user_id AND scope = 'status'
+          AND key = (SELECT name FROM statuses WHERE code = OLD.status);
+        INSERT INTO stats (user_id, scope, key, n)
+        VALUES (NEW.user_id, 'status', (SELECT name FROM statuses WHERE code = NEW.status), 1)
+        ON CONFLICT (user_id, scope, key) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_rollup_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO daily_rollup (user_id, day, status, n)
+        VALUES (NEW.user_id, date(NEW.day * 86400, 'unixepoch'), (SELECT name FROM statuses WHERE code = NEW.status), 1)
+        ON CONFLICT (user_id, day, status) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_rollup_delete AFTER DELETE ON applications
+    BEGIN
+        UPDATE daily_rollup SET n = n - 1
+        WHERE user_id = OLD.user_id AND day = date(OLD.day * 86400, 'unixepoch')
+          AND status = (SELECT name FROM statuses WHERE code = OLD.status);
+    END;
+
+    CREATE TRIGGER trg_rollup_update AFTER UPDATE OF status, day ON applications
+    BEGIN
+        UPDATE daily_rollup SET n = n - 1
+        WHERE user_id = OLD.user_id AND day = date(OLD.day * 86400, 'unixepoch')
+          AND status = (SELECT name FROM statuses WHERE code = OLD.status);
+        INSERT INTO daily_rollup (user_id, day, status, n)
+        VALUES (NEW.user_id, date(NEW.day * 86400, 'unixepoch'), (SELECT name FROM statuses WHERE code = NEW.status), 1)
+        ON CONFLICT (user_id, day, status) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_roles_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO role_counts (user_id, role, n)
+        VALUES (NEW.user_id, (SELECT name FROM roles WHERE id = NEW.role_id), 1)
+        ON CONFLICT (user_id, role) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_roles_delete AFTER DELETE ON applications
+    BEGIN
+        UPDATE role_counts SET n = n - 1
+        WHERE user_id = OLD.user_id AND role = (SELECT name FROM roles WHERE id = OLD.role_id);
+    END;
+
+    CREATE TRIGGER trg_roles_update AFTER UPDATE OF role_id ON applications
+    BEGIN
+        UPDATE role_counts SET n = n - 1
+        WHERE user_id = OLD.user_id AND role = (SELECT name FROM roles WHERE id = OLD.role_id);
+        INSERT INTO role_counts (user_id, role, n)
+        VALUES (NEW.user_id, (SELECT name FROM roles WHERE id = NEW.role_id), 1)
+        ON CONFLICT (user_id, role) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_companies_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO company_counts (user_id, company, n)
+        VALUES (NEW.user_id, (SELECT name FROM companies WHERE id = NEW.company_id), 1)
+        ON CONFLICT (user_id, company) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_companies_delete AFTER DELETE ON applications
+    BEGIN
+        UPDATE company_counts SET n = n - 1
+        WHERE user_id = OLD.user_id AND company = (SELECT name FROM companies WHERE id = OLD.company_id);
+    END;
+
+    CREATE TRIGGER trg_companies_update AFTER UPDATE OF company_id ON applications
+    BEGIN
+        UPDATE company_counts SET n = n - 1
+        WHERE user_id = OLD.user_id AND company = (SELECT name FROM companies WHERE id = OLD.company_id);
+        INSERT INTO company_counts (user_id, company, n)
+        VALUES (NEW.user_id, (SELECT name FROM companies WHERE id = NEW.company_id), 1)
+        ON CONFLICT (user_id, company) DO UPDATE SET n = n + 1;
+    END;
+
+    CREATE TRIGGER trg_events_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO status_events (user_id, app_id, status, at)
+        VALUES (NEW.user_id, NEW.id, (SELECT name FROM statuses WHERE code = NEW.status),
+                strftime('%Y-%m-%d %H:%M:%S', 'now'));
+    END;
+
+    CREATE TRIGGER trg_events_update AFTER UPDATE OF status ON applications
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+        INSERT INTO status_events (user_id, app_id, status, at)
+        VALUES (NEW.user_id, NEW.id, (SELECT name FROM statuses WHERE code = NEW.status),
+                strftime('%Y-%m-%d %H:%M:%S', 'now'));
+    END;
+
+    CREATE TRIGGER trg_changes_update AFTER UPDATE ON applications
+    BEGIN
+        INSERT INTO app_changes (app_id) VALUES (OLD.id);
+    END;
+
+    CREATE TRIGGER trg_changes_delete AFTER DELETE ON applications
+    BEGIN
+        INSERT INTO app_changes (app_id) VALUES (OLD.id);
+    END;
+    """,
+
+    # 12: step 5's trigram index again, over applications_text now that the names live in
+    # companies/roles. Optional like step 5
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS applications_fts USING fts5(
+        company, role,
+        content = 'applications_text', content_rowid = 'id',
+        tokenize = 'trigram'
+    );
+
+    DROP TRIGGER IF EXISTS trg_fts_insert;
+    DROP TRIGGER IF EXISTS trg_fts_delete;
+    DROP TRIGGER IF EXISTS trg_fts_update;
+
+    CREATE TRIGGER trg_fts_insert AFTER INSERT ON applications
+    BEGIN
+        INSERT INTO applications_fts (rowid, company, role)
+        VALUES (NEW.id, (SELECT name FROM companies WHERE id = NEW.company_id),
+                (SELECT name FROM roles WHERE id = NEW.role_id));
+    END;
+
+    CREATE TRIGGER trg_fts_delete AFTER DELETE ON applications
+    BEGIN
+        INSERT INTO applications_fts (applications_fts, rowid, company, role)
+        VALUES ('delete', OLD.id, (SELECT name FROM companies WHERE id = OLD.company_id),
+                (SELECT name FROM roles WHERE id = OLD.role_id));
+    END;
+
+    CREATE TRIGGER trg_fts_update AFTER UPDATE OF company_id, role_id ON applications
+    BEGIN
+        INSERT INTO applications_fts (applications_fts, rowid, company, role)
+        VALUES ('delete', OLD.id, (SELECT name FROM companies WHERE id = OLD.company_id),
+                (SELECT name FROM roles WHERE id = OLD.role_id));
+        INSERT INTO applications_fts (rowid, company, role)
+        VALUES (NEW.id, (SELECT name FROM companies WHERE id = NEW.company_id),
+                (SELECT name FROM roles WHERE id = NEW.role_id));
+    END;
+
+    INSERT INTO applications_fts (applications_fts) VALUES ('rebuild');
+    """,
+
+    # 13: app_changes is only written while snapshot.py uses it, otherwise every update and
+    # delete paid for a log that nothing read or pruned. Logging is on while meta holds
+    # 'change_log_since' (the app_changes seq it started at): snapshot.py sets it when it builds
+    # its file, db.init_db clears it and the log when a process starts
+    """
+    DROP TRIGGER IF EXISTS trg_changes_update;
+    DROP TRIGGER IF EXISTS trg_changes_delete;
+
+    CREATE TRIGGER trg_changes_update AFTER UPDATE ON applications
+    WHEN EXISTS (SELECT 1 FROM meta WHERE key = 'change_log_since')
+    BEGIN
+        INSERT INTO app_changes (app_id) VALUES (OLD.id);
+    END;
+
+    CREATE TRIGGER trg_changes_delete AFTER DELETE ON applications
+    WHEN EXISTS (SELECT 1 FROM meta WHERE key = 'change_log_since')
+    BEGIN
+        INSERT INTO app_changes (app_id) VALUES (OLD.id);
+    END;
+
+    DELETE FROM app_changes;
+    """,
+]
+
+# steps the app can live without: version -> what is lost when this sqlite build can't run it.
+# A failed optional step is rolled back and skipped, the version still moves past it
+OPTIONAL_STEPS = {
+    5: "full-text search needs fts5 with the trigram tokenizer, company/role filters use LIKE",
+    12: "full-text search needs fts5 with the trigram tokenizer, company/role filters use LIKE",
+}
+
+# rows a step couldn't carry over, logged after it runs: version -> (count query, message)
+STEP_REPORTS = {
+    11: ("SELECT COUNT(*) FROM applications_undated",
+         "%d application(s) had a date_applied that isn't a date, they were moved to applications_undated"),
+}
+
+LATEST_VERSION = len(MIGRATIONS)
+
+# how long a process waits for another one that is migrating the same file (a big step 11 can
+# take a while), instead of the connection's usual busy_timeout
+MIGRATE_BUSY_TIMEOUT_MS = 600_000
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def _statements(script):
+    # a step's statements one by one: executescript would commit the step's transaction first.
+    # Trigger bodies hold ';' too, complete_statement knows where a statement really ends
+    statement = ""
+    for part in script.split(";"):
+        statement += part + ";"
+        if sqlite3.complete_statement(statement):
+            if statement.strip(" \n;"):
+                yield statement
+            statement = ""
+
+
+def _apply_step(conn, version):
+    """
+    Run step `version` and its user_version bump in one BEGIN IMMEDIATE transaction.
+    user_version is read again once the write lock is held, a step another process applied
+    in the meantime is skipped (returns False), so the version never goes back.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if schema_version(conn) >= version:
+            conn.rollback()
+            return False
+
+        conn.execute("SAVEPOINT step")
+        try:
+            for statement in _statements(MIGRATIONS[version - 1]):
+                conn.execute(statement)
+        except sqlite3.OperationalError as e:
+            if version not in OPTIONAL_STEPS:
+                raise
+            # undo the half-run step but keep the lock, the version still moves past it
+            conn.execute("ROLLBACK TO step")
+            logger.warning("Skipping schema step %d (%s): %s", version, e, OPTIONAL_STEPS[version])
+        conn.execute("RELEASE step")
+
+        report = STEP_REPORTS.get(version)
+        n = conn.execute(report[0]).fetchone()[0] if report else 0
+
+        conn.execute(f"PRAGMA user_version = {version};")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    if n:
+        logger.warning(report[1], n)
+    return True
+
+
+def migrate(conn):
+    """
+    Bring the database behind conn up to LATEST_VERSION. Returns the list of versions applied
+    by this call. A database newer than this code is left alone rather than guessed at.
+    """
+    current = schema_version(conn)
+    if current > LATEST_VERSION:
+        raise RuntimeError(f"Database schema is version {current}, this code only knows up to {LATEST_VERSION}")
+    if current == LATEST_VERSION:
+        return []
+
+    busy_timeout = conn.execute("PRAGMA busy_timeout;").fetchone()[0]
+    conn.execute(f"PRAGMA busy_timeout = {max(busy_timeout, MIGRATE_BUSY_TIMEOUT_MS)};")
+    try:
+        return [version for version in range(current + 1, LATEST_VERSION + 1) if _apply_step(conn, version)]
+    finally:
+        conn.execute(f"PRAGMA busy_timeout = {busy_timeout};")
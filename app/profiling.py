@@ -0,0 +1,265 @@
+"""
+Timing for the hot paths: every SQL statement run through db.py's connections, every function
+wrapped in @timed and every `with span(name):` block.
+Off by default: JOBTRACKER_PROFILE=1 or enable() turn it on for the whole process, record_thread()
+for the calling thread only (ui.py does for one ?debug=1 rerun). While off the hooks are two flag
+checks.
+
+Each record is a dict {seq, kind ('sql' | 'call' | 'span'), name, ms, rows, thread, plan} kept
+in a bounded ring buffer for the debug panel and logged as one JSON line to the
+"jobtracker.profile" logger (DEBUG, WARNING for statements slower than SLOW_QUERY_MS, which
+also get their EXPLAIN QUERY PLAN).
+"""
+import functools
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("JOBTRACKER_PROFILE", "") not in ("", "0")
+SLOW_QUERY_MS = 50.0
+MAX_RECORDS = 2000
+SQL_PREVIEW_CHARS = 300
+
+logger = logging.getLogger("jobtracker.profile")
+
+_records = deque(maxlen=MAX_RECORDS)
+_seq = itertools.count(1)
+_lock = threading.Lock()
+
+
+class _ThreadFlag(threading.local):
+    on = False
+
+
+_thread = _ThreadFlag()
+
+
+def enable(on=True):
+    global ENABLED
+    ENABLED = bool(on)
+
+
+def record_thread(on=True):
+    """Record the calling thread's hooks (one Streamlit rerun) whether or not ENABLED is set"""
+    _thread.on = bool(on)
+
+
+def mark():
+    """Sequence number to pass to records(since=...) to get only what happened after this call"""
+    with _lock:
+        return _records[-1]["seq"] if _records else 0
+
+
+def clear():
+    with _lock:
+        _records.clear()
+
+
+def records(since=0, this_thread=False):
+    """Records newer than since, oldest first. this_thread keeps only the calling thread's
+    (one Streamlit session's rerun)"""
+    thread = threading.get_ident()
+    with _lock:
+        return [dict(r) for r in _records
+                if r["seq"] > since and (not this_thread or r["thread"] == thread)]
+
+
+def _compact_sql(sql):
+    sql = " ".join(sql.split())
+    return sql if len(sql) <= SQL_PREVIEW_CHARS else sql[:SQL_PREVIEW_CHARS] + "..."
+
+
+def _rows_of(value):
+    # row count of a function result, when it has one
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    try:
+        return len(value) if hasattr(value, "shape") or isinstance(value, list) else None
+    except TypeError:
+        return None
+
+
+def _add(kind, name, ms, rows=None, plan=None):
+    record = {"seq": 0, "kind": kind, "name": name, "ms": round(ms, 3), "rows": rows,
+              "thread": threading.get_ident(), "plan": plan}
+    with _lock:
+        record["seq"] = next(_seq)
+        _records.append(record)
+    return record
+
+
+def _log(record):
+    slow = record["kind"] == "sql" and record["ms"] >= SLOW_QUERY_MS
+    level = logging.WARNING if slow else logging.DEBUG
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({k: v for k, v in record.items() if v is not None}))
+
+
+def timed(fn):
+    """Record every call of fn (name, duration, rows in the result) while profiling is on"""
+    name = f"{fn.__module__}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not (ENABLED or _thread.on):
+            return fn(*args, **kwargs)
+        t0 = time.perf_counter()
+        result = fn(*args, **kwargs)
+        _log(_add("call", name, (time.perf_counter() - t0) * 1000, _rows_of(result)))
+        return result
+
+    return wrapper
+
+
+@contextmanager
+def span(name):
+    """Time a block, e.g. building one chart: `with span("chart: calendar"):`"""
+    if not (ENABLED or _thread.on):
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _log(_add("span", name, (time.perf_counter() - t0) * 1000))
+
+
+def _explain(conn, sql, params):
+    # runs on the base class so the plan query doesn't profile itself
+    try:
+        cur = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params)
+        return [row[3] for row in cur.fetchall()]
+    except sqlite3.Error:
+        return None
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    Times execute/executemany and the fetches that follow (sqlite does most of a query's work
+    while rows are being fetched), so one record covers a statement from start to last row.
+    The record is logged once the statement is done: right away for writes, when the last row
+    has been fetched for queries.
+    """
+    _record = None
+
+    def _start(self, sql, params, t0):
+        self._finish()
+        self._record = _add("sql", _compact_sql(sql), (time.perf_counter() - t0) * 1000,
+                            self.rowcount if self.rowcount >= 0 else 0)
+        self._sql, self._params = sql, params
+        self._check_slow()
+        if self.description is None:
+            self._finish()
+
+    def _fetched(self, rows, t0, done):
+        record = self._record
+        record["ms"] = round(record["ms"] + (time.perf_counter() - t0) * 1000, 3)
+        record["rows"] += rows
+        self._check_slow()
+        if done:
+            self._finish()
+
+    def _check_slow(self):
+        record = self._record
+        if record["plan"] is None and record["ms"] >= SLOW_QUERY_MS:
+            record["plan"] = _explain(self.connection, self._sql, self._params) or []
+
+    def _finish(self):
+        if self._record is not None:
+            _log(self._record)
+            self._record = None
+
+    def execute(self, sql, params=()):
+        if not (ENABLED or _thread.on):
+            return super().execute(sql, params)
+        t0 = time.perf_counter()
+        super().execute(sql, params)
+        self._start(sql, params, t0)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        if not (ENABLED or _thread.on):
+            return super().executemany(sql, seq_of_params)
+        t0 = time.perf_counter()
+        super().executemany(sql, seq_of_params)
+        self._start(sql, (), t0)
+        return self
+
+    def fetchone(self):
+        if self._record is None:
+            return super().fetchone()
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(row is not None, t0, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        if self._record is None:
+            return super().fetchmany(size)
+        t0 = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(len(rows), t0, len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        if self._record is None:
+            return super().fetchall()
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(len(rows), t0, True)
+        return rows
+
+    def __next__(self):
+        if self._record is None:
+            return super().__next__()
+        t0 = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(0, t0, True)
+            raise
+        self._fetched(1, t0, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # queries read with a single fetchone() are never exhausted
+        self._finish()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """sqlite3 connection whose conn.execute()/executemany() go through ProfiledCursor"""
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+def summarize(recs):
+    """Group records by (kind, name): calls, total/max ms, rows, plan of the slowest; slowest total first"""
+    groups = {}
+    for r in recs:
+        g = groups.setdefault((r["kind"], r["name"]), {
+            "kind": r["kind"], "name": r["name"], "calls": 0, "total_ms": 0.0, "max_ms": 0.0,
+            "rows": 0, "plan": None})
+        g["calls"] += 1
+        g["total_ms"] += r["ms"]
+        g["rows"] += r["rows"] or 0
+        if r["ms"] >= g["max_ms"]:
+            g["max_ms"] = r["ms"]
+            g["plan"] = r["plan"] or g["plan"]
+    return sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)
@@ -1,17 +1,48 @@
+"""
+Synthetic job applications, for demos, import testing and benchmarks.
+Rows are generated in numpy batches, so 10M rows stream into the database (or a CSV)
+without ever being held in memory at once. Every (company, role, date_applied) is distinct,
+so n rows generated is n rows stored.
+
+    python sample_data.py --rows 100000 --db /tmp/demo.db
+    python sample_data.py --rows 48 --csv sample_applications.csv --aliases
+    python sample_data.py --rows 1000000 --db /tmp/big.db --start 2022-01-01 --end 2025-12-31 \
+        --status Applied=50,Rejected=35,OA=8,Interview=5,Offer=2
+"""
+import argparse
+import datetime as dt
+import math
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-from datetime import date, timedelta
-import random
 
-random.seed(7)
+import db
+from importer import STATUS_ALIASES
 
-companies = [
+BATCH_ROWS = 50_000
+SPAN_DAYS = 365
+
+COMPANIES = [
     "Intuitive Surgical", "Notion", "eBay", "Cisco", "Western Digital",
     "Google", "Microsoft", "NVIDIA", "Meta", "Amazon",
     "Databricks", "Snowflake", "DoorDash", "Airbnb", "LinkedIn",
     "Stripe", "Square", "OpenAI", "Uber", "Lyft"
 ]
 
-roles = [
+# made-up company names beyond COMPANIES are "<first> <second>", e.g. "Northwind Analytics"
+COMPANY_FIRST = [
+    "Acme", "Blue", "Bright", "Cedar", "Crimson", "Delta", "Evergreen", "Falcon", "Granite",
+    "Harbor", "Iron", "Juniper", "Keystone", "Lumen", "Maple", "Northwind", "Orbit", "Pioneer",
+    "Quantum", "Redwood", "Summit", "Tidal", "Union", "Vertex", "Willow", "Zenith",
+]
+COMPANY_SECOND = [
+    "Analytics", "Bank", "Bio", "Capital", "Cloud", "Data", "Dynamics", "Energy", "Foods",
+    "Games", "Health", "Insurance", "Labs", "Logistics", "Media", "Motors", "Networks",
+    "Robotics", "Security", "Software", "Systems", "Technologies", "Therapeutics", "Ventures",
+]
+
+ROLES = [
     "Data Scientist Intern", "Machine Learning Engineer Intern",
     "Software Engineer", "Software Engineer Intern",
     "Data Analyst", "Business Analyst",
@@ -20,32 +51,154 @@ roles = [
     "Backend Engineer", "Frontend Engineer", "Full Stack Engineer",
     "Business Intelligence Analyst", "Quant Research Intern"
 ]
+ROLE_LEVELS = ["", "Junior ", "Senior ", "Staff ", "Lead "]
+ROLE_TEAMS = ["", ", Ads", ", Payments", ", Search", ", Platform", ", Growth", ", Risk", ", Infrastructure"]
+
+# share of each status (weights, they don't have to add up to 1)
+STATUS_WEIGHTS = {"Applied": 55, "Rejected": 30, "OA": 8, "Interview": 5, "Offer": 2}
+
+
+def company_names(n: int):
+    """The first n company names: COMPANIES, then made-up ones (numbered once those run out)"""
+    names = list(COMPANIES)
+    names += [f"{a} {b}" for b in COMPANY_SECOND for a in COMPANY_FIRST]
+    names += [f"{names[i % len(names)]} {i // len(names) + 1}" for i in range(max(n - len(names), 0))]
+    return names[:n]
+
+
+def role_names(n: int):
+    """The first n role titles, ROLES with seniority levels and teams added"""
+    names = [f"{level}{role}{team}" for team in ROLE_TEAMS for level in ROLE_LEVELS for role in ROLES]
+    names += [f"{names[i % len(names)]} {i // len(names) + 2}" for i in range(max(n - len(names), 0))]
+    return names[:n]
+
+
+def parse_status_weights(text: str):
+    """'Applied=55,Rejected=30' -> {'Applied': 55.0, 'Rejected': 30.0}"""
+    weights = {}
+    for part in text.split(","):
+        status, _, weight = part.partition("=")
+        status = status.strip()
+        if status not in db.STATUSES:
+            raise ValueError(f"Unknown status {status!r}, expected one of {db.STATUSES}")
+        weights[status] = float(weight)
+    return weights
+
+
+def _key_space(n_rows, n_days):
+    # enough companies and roles that (company, role, day) has at least 4x n_rows combinations,
+    # roles grow slower than companies like they do in real data
+    combos = max(4 * n_rows / n_days, 1)
+    n_roles = int(min(max(math.sqrt(combos) / 4, len(ROLES)), 5_000))
+    n_companies = max(math.ceil(combos / n_roles), len(COMPANIES))
+    return n_companies, n_roles
+
+
+def generate_batches(n_rows: int, seed: int = 7, start=None, end=None,
+                     status_weights=None, batch_size: int = BATCH_ROWS, aliases: bool = False):
+    """
+    Yield n_rows distinct applications as lists of (company, role, date_applied, status) tuples,
+    batch_size at a time (the shape db.import_batches takes).
+    Dates are spread over [start, end], by default the SPAN_DAYS up to today.
+    status_weights maps status -> weight (default STATUS_WEIGHTS). With aliases, statuses are
+    written the ways importer.STATUS_ALIASES understands ("phone screen", "declined", ...).
+    """
+    end = pd.Timestamp(end or dt.date.today()).normalize()
+    start = pd.Timestamp(start).normalize() if start else end - pd.Timedelta(days=SPAN_DAYS - 1)
+    n_days = (end - start).days + 1
+    if n_days < 1:
+        raise ValueError("start must not be after end")
+
+    n_companies, n_roles = _key_space(n_rows, n_days)
+    companies = np.array(company_names(n_companies), dtype=object)
+    roles = np.array(role_names(n_roles), dtype=object)
+    days = np.datetime_as_string(np.datetime64(start.date()) + np.arange(n_days), unit="D").astype(object)
+
+    weights = status_weights or STATUS_WEIGHTS
+    statuses = list(weights)
+    p = np.array([weights[s] for s in statuses], dtype=float)
+    p /= p.sum()
+
+    if aliases:
+        spellings = {s: [alias for alias, target in STATUS_ALIASES.items() if target == s] for s in statuses}
+        spellings = {s: np.array([s] + names, dtype=object) for s, names in spellings.items()}
+
+    # row i gets key (a * i + b) mod space: a bijection when gcd(a, space) == 1, so keys never
+    # repeat. a * i stays far below 2**63 for any row count that fits in a database
+    rng = np.random.default_rng(seed)
+    space = n_companies * n_roles * n_days
+    a = int(rng.integers(space // 3, space)) | 1
+    while math.gcd(a, space) != 1:
+        a += 2
+    b = int(rng.integers(0, space))
+
+    for lo in range(0, n_rows, batch_size):
+        i = np.arange(lo, min(lo + batch_size, n_rows), dtype=np.int64)
+        key = (i * a + b) % space
+
+        day_idx = key % n_days
+        role_idx = (key // n_days) % n_roles
+        company_idx = key // (n_days * n_roles)
+
+        status = np.array(statuses, dtype=object)[rng.choice(len(statuses), size=len(i), p=p)]
+        if aliases:
+            status = np.array([spellings[s][rng.integers(len(spellings[s]))] for s in status], dtype=object)
+
+        yield list(zip(companies[company_idx].tolist(), roles[role_idx].tolist(),
+                       days[day_idx].tolist(), status.tolist()))
+
+
+def generate_frame(n_rows: int, **kwargs) -> pd.DataFrame:
+    """generate_batches() as one DataFrame ['company', 'role', 'date_applied', 'status'], sorted by date"""
+    rows = [row for batch in generate_batches(n_rows, **kwargs) for row in batch]
+    df = pd.DataFrame(rows, columns=["company", "role", "date_applied", "status"])
+    return df.sort_values("date_applied", kind="stable").reset_index(drop=True)
+
+
+def write_csv(path, n_rows: int, **kwargs):
+    """Write generate_batches() rows to a CSV with a header, one batch at a time. Returns path"""
+    path = Path(path)
+    header = True
+    for batch in generate_batches(n_rows, **kwargs):
+        pd.DataFrame(batch, columns=["company", "role", "date_applied", "status"]).to_csv(
+            path, mode="w" if header else "a", header=header, index=False)
+        header = False
+    return path
+
+
+def populate(n_rows: int, on_conflict="update", progress=None, user_id=db.DEFAULT_USER, **kwargs):
+    """Upsert generate_batches() rows into user_id's applications in the current database (see db.import_batches)"""
+    return db.import_batches(generate_batches(n_rows, **kwargs), on_conflict=on_conflict, progress=progress,
+                             user_id=user_id)
 
-# Allowed plus synonyms user mapping handles
-status_pool = [
-    "Applied", "OA", "Interview", "Offer", "Rejected",
-    "submitted", "online assessment", "assessment",
-    "phone screen", "onsite", "offer accepted", "declined"
-]
 
-today = date.today()
-rows = []
-num_rows = 48  # ~7 weeks worth
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--db", help="database file to populate (created if missing)")
+    target.add_argument("--csv", help="CSV file to write")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--start", help="first date_applied, YYYY-MM-DD")
+    parser.add_argument("--end", help="last date_applied, YYYY-MM-DD (default today)")
+    parser.add_argument("--status", type=parse_status_weights, help="e.g. Applied=55,Rejected=30,OA=8")
+    parser.add_argument("--aliases", action="store_true", help="spell statuses the way CSV exports do (CSV only)")
+    parser.add_argument("--user", default=db.DEFAULT_USER, help="username that owns the rows (--db only)")
+    args = parser.parse_args()
 
-for i in range(num_rows):
-    d = today - timedelta(days=random.randint(0, 60))
-    rows.append({
-        "company": random.choice(companies),
-        "role": random.choice(roles),
-        "date_applied": d.isoformat(),
-        "status": random.choice(status_pool)
-    })
+    options = dict(seed=args.seed, start=args.start, end=args.end, status_weights=args.status)
 
-df = pd.DataFrame(rows).sort_values("date_applied").reset_index(drop=True)
+    if args.csv:
+        print(write_csv(args.csv, args.rows, aliases=args.aliases, **options))
+        return
 
-path = "/mnt/data/sample_applications.csv"
-df.to_csv(path, index=False)
+    db.set_db_path(args.db)
+    db.init_db()
+    report = populate(args.rows, progress=lambda done: print(f"\r{done:,} rows", end="", flush=True),
+                      user_id=args.user, **options)
+    print(f"\ninserted {report['inserted']:,}, updated {report['updated']:,}, skipped {report['skipped']:,}")
+    db.get_pool().close_all()
 
-import caas_jupyter_tools as cj
-cj.display_dataframe_to_user("Sample applications CSV (preview)", df.head(20))
 
+if __name__ == "__main__":
+    main()
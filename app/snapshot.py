@@ -0,0 +1,204 @@
+"""
+Columnar copy of applications for analytics, kept in an Arrow IPC file next to the database
+(job_apps.db -> job_apps.arrow).
+The file is read through a memory map, so reading it costs no parsing or copying and every
+process on the machine shares the same pages through the OS page cache.
+
+It is refreshed on read when the database has moved on: rows above the last id it saw are
+new, and app_changes (migrations 10 and 13) lists the ids updated or deleted since. Only those
+rows are read from SQLite, the rest is carried over from the old file. Each file holds the
+watermarks it was built at in its schema metadata.
+app_changes is only logged from the first refresh on (and until a process runs db.init_db),
+a file from before logging last started can't be brought up to date and is built again.
+"""
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import db
+from profiling import timed
+
+FETCH_ROWS = 50_000
+# a refreshed file is rewritten as one batch once it has gathered this many small ones
+MAX_BATCHES = 32
+
+SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("user_id", pa.string()),
+    ("company", pa.string()),
+    ("role", pa.string()),
+    ("date_applied", pa.date32()),
+    ("status", pa.dictionary(pa.int8(), pa.string())),
+])
+# stored codes and day numbers go straight into the Arrow columns, only names are joined in
+SELECT_SQL = """
+    SELECT a.id, a.user_id, c.name, r.name, a.day, a.status
+    FROM applications AS a
+    JOIN companies AS c ON c.id = a.company_id
+    JOIN roles AS r ON r.id = a.role_id"""
+
+# db path -> (watermarks, data_version, table) of the last snapshot this process read
+_loaded = {}
+_lock = threading.Lock()
+
+
+def snapshot_path():
+    return db.DB_PATH.with_suffix(".arrow")
+
+
+def _watermarks(conn):
+    # (last application id ever handed out, last app_changes seq, app_changes seq logging
+    # started at or -1 while it is off), all O(1) from sqlite_sequence and meta
+    seqs = dict(conn.execute(
+        "SELECT name, seq FROM sqlite_sequence WHERE name IN ('applications', 'app_changes')").fetchall())
+    since = conn.execute("SELECT value FROM meta WHERE key = 'change_log_since'").fetchone()
+    return seqs.get("applications", 0), seqs.get("app_changes", 0), since[0] if since is not None else -1
+
+
+def _start_change_log(conn):
+    # an entry of its own gives this logging period a seq no earlier one can have (app_id 0 is
+    # no application). Returns that seq
+    seq = conn.execute("INSERT INTO app_changes (app_id) VALUES (0) RETURNING seq").fetchone()[0]
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('change_log_since', ?)", (seq,))
+    return seq
+
+
+def _batch(rows):
+    # SQLite rows -> record batch, one C-level pass per column
+    ids, users, companies, roles, days, codes = zip(*rows)
+    return pa.record_batch([
+        pa.array(ids, pa.int64()),
+        pa.array(users, pa.string()),
+        pa.array(companies, pa.string()),
+        pa.array(roles, pa.string()),
+        # date32 is days since 1970-01-01 too
+        pa.array(days, pa.int32()).cast(pa.date32()),
+        pa.DictionaryArray.from_arrays(pa.array(codes, pa.int8()), pa.array(db.STATUSES)),
+    ], schema=SCHEMA)
+
+
+def _read_rows(conn, sql, params):
+    cur = conn.execute(sql, params)
+    cur.row_factory = None
+    batches = []
+    while rows := cur.fetchmany(FETCH_ROWS):
+        batches.append(_batch(rows))
+    return batches
+
+
+def _open(path):
+    # (watermarks, table) of the file on disk, None when there is none (or it can't be read)
+    try:
+        # the table's buffers point into the map, it stays mapped for as long as they live
+        table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    meta = table.schema.metadata or {}
+    if b"log_since" not in meta or table.schema.remove_metadata() != SCHEMA:
+        return None
+    marks = int(meta[b"max_id"]), int(meta[b"change_seq"]), int(meta[b"log_since"])
+    return marks, table.replace_schema_metadata(None)
+
+
+def _write(path, table, marks):
+    if table.num_rows and len(table.to_batches()) > MAX_BATCHES:
+        table = table.combine_chunks()
+    table = table.replace_schema_metadata(dict(zip(("max_id", "change_seq", "log_since"), map(str, marks))))
+    # written next to the old file and renamed over it: readers that still map the old
+    # file keep it until they let go, nobody ever sees half a file
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def _refresh(conn, path):
+    """
+    Bring the file up to date, under the database write lock so that only one process
+    rewrites it at a time and no app_changes entry is pruned before a file holds it.
+    Returns (watermarks, table)
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    marks = _watermarks(conn)
+
+    # another process may have just done it
+    old = _open(path)
+    if old is not None and old[0] == marks:
+        return old
+
+    if marks[2] == -1:
+        seq = _start_change_log(conn)
+        marks = (marks[0], seq, seq)
+    # start over from a file made before logging last started (app_changes misses whatever
+    # changed in between), or one ahead of the database (it belongs to some other copy of it)
+    if old is not None and (old[0][2] != marks[2] or old[0][0] > marks[0] or old[0][1] > marks[1]):
+        old = None
+
+    if old is None:
+        table = pa.Table.from_batches(_read_rows(conn, SELECT_SQL, ()), schema=SCHEMA)
+    else:
+        (max_id, change_seq, _), table = old
+        changed = pa.array([r[0] for r in conn.execute(
+            "SELECT DISTINCT app_id FROM app_changes WHERE seq > ? AND app_id <= ?", (change_seq, max_id))],
+            pa.int64())
+        if len(changed):
+            table = table.filter(pc.invert(pc.is_in(table["id"], value_set=changed)))
+        batches = _read_rows(conn, f"{SELECT_SQL} WHERE a.id IN (SELECT value FROM json_each(?))",
+                             (str(changed.to_pylist()),)) if len(changed) else []
+        batches += _read_rows(conn, f"{SELECT_SQL} WHERE a.id > ?", (max_id,))
+        table = pa.concat_tables([table, pa.Table.from_batches(batches, schema=SCHEMA)])
+
+    _write(path, table, marks)
+    conn.execute("DELETE FROM app_changes WHERE seq <= ?", (marks[1],))
+    return marks, table
+
+
+@timed
+def applications_table(user_id=None):
+    """
+    applications as a pyarrow Table (id, user_id, company, role, date_applied as date32,
+    status dictionary-encoded), memory-mapped from the snapshot file and refreshed first if the
+    database has changed. user_id keeps only that user's rows, None keeps everyone's.
+    """
+    path = snapshot_path()
+    key = str(path)
+    version = db.data_version()
+
+    with _lock:
+        entry = _loaded.get(key)
+        if entry is None or entry[1] != version:
+            with db.get_connection() as conn:
+                marks = _watermarks(conn)
+                current = entry if entry is not None and entry[0] == marks else None
+                if current is None:
+                    on_disk = _open(path)
+                    current = on_disk if on_disk is not None and on_disk[0] == marks else _refresh(conn, path)
+            # pruning app_changes counts as a write, so read the version again
+            entry = _loaded[key] = (current[0], db.data_version(), current[-1])
+        table = entry[2]
+
+    if user_id is not None:
+        table = table.filter(pc.equal(table["user_id"], user_id))
+    return table
+
+
+def value_counts(table, column):
+    """{value: n} counts of one string column as a pandas Series, most common first"""
+    counts = table.group_by(column).aggregate([(column, "count")])
+    s = counts.to_pandas().set_index(column)[f"{column}_count"].rename("n")
+    return s.sort_values(ascending=False, kind="stable")
+
+
+def per_day(table, date_start=None, date_end=None):
+    """Applications per date_applied as a pandas Series indexed by datetime64 day"""
+    if date_start is not None:
+        table = table.filter(pc.greater_equal(table["date_applied"], pa.scalar(pd.Timestamp(date_start).date(), pa.date32())))
+    if date_end is not None:
+        table = table.filter(pc.less_equal(table["date_applied"], pa.scalar(pd.Timestamp(date_end).date(), pa.date32())))
+    counts = table.group_by("date_applied").aggregate([("id", "count")]).to_pandas()
+    s = counts.set_index(counts["date_applied"].astype("datetime64[ns]"))["id_count"].rename("n")
+    s.index.name = "day"
+    return s.sort_index()
@@ -1,17 +1,18 @@
 import streamlit as st
-from db import init_db, seed_sample_row, list_applications_df, add_application,\
-      update_status, delete_application, get_connection, delete_all_apps,\
-      init_id_counter_if_missing, get_next_id, bump_next_id
+from db import init_db, seed_sample_row, list_applications_page, add_application,\
+      apply_batch, delete_all_apps, claim_rows, DEFAULT_USER
 from audio import play_success
-from analytics import count_apps_this_week, weekly_applications, get_status_count, top_companies, calendar_counts, calendar_month_ticks, top_role_terms
+from importer import sniff_csv, preview_csv, date_formats, check_mapping, import_csv
+from exporter import FORMATS, available_formats, export_bytes
+import profiling
+from profiling import span
 import pandas as pd
-import plotly.express as px
-import numpy as np
 import datetime as dt
-import altair as alt
-import streamlit_authenticator as stauth
-import yaml
-from yaml.loader import SafeLoader
+# analytics, plotly, altair and streamlit_authenticator are imported where they are first used,
+# so opening the Applications tab doesn't pay for them
+
+# a thread can go on to run other reruns, profiling only records the ones that ask for it (below)
+profiling.record_thread(False)
 
 init_db()
 #seed_sample_row()
@@ -24,6 +25,8 @@ auth_status = True
 
 config = st.secrets.get("auth_config")
 if config:
+    import streamlit_authenticator as stauth
+
     authenticator = stauth.Authenticate(
         config["credentials"],
         config["cookie"]["name"],
@@ -37,6 +40,27 @@ if config:
         st.info("Please log in"); st.stop()
 
 
+# everything below reads and writes only this user's applications
+user_id = username or DEFAULT_USER
+
+# rows stored before logins were turned on have no owner (DEFAULT_USER), the user named by the
+# legacy_owner secret takes them over at login
+if username is not None and username == st.secrets.get("legacy_owner") and "claimed" not in st.session_state:
+    claimed = st.session_state["claimed"] = claim_rows(username)
+    if claimed["moved"]:
+        st.toast(f"Moved {claimed['moved']:,} applications from before logins to your account")
+    if claimed["left"]:
+        st.warning(f"{claimed['left']:,} applications from before logins were left where they were, "
+                   "you already have one with the same company, role and date")
+
+# ?debug=1 records this rerun only and shows what it spent its time on, for logged-in users listed
+# in the debug_users secret (anyone when the server runs with JOBTRACKER_PROFILE=1)
+debug = st.query_params.get("debug") == "1" and (
+    profiling.ENABLED or (username is not None and username in st.secrets.get("debug_users", [])))
+if debug:
+    profiling.record_thread()
+profile_since = profiling.mark()
+
 if authenticator:
     authenticator.logout("Logout", "sidebar")
 st.sidebar.write(f"Hi, {name}")
@@ -44,7 +68,8 @@ st.sidebar.write(f"Hi, {name}")
 st.set_page_config(page_title="TrackJob", layout="wide")
 st.title("Track and log your job apps")
 
-tab_apps, tab_analytics = st.tabs(["Applications", "Analytics"])
+# on_change="rerun" makes tabs lazy: only the open tab's block runs
+tab_apps, tab_analytics = st.tabs(["Applications", "Analytics"], key="main_tab", on_change="rerun")
 
 def render_add_application_form():
     """
@@ -61,14 +86,12 @@ def render_add_application_form():
 
     if submitted:
         try:
-            new_id = get_next_id()
-            bump_next_id()
-            add_application(company, role, date, status)
+            add_application(company, role, date, status, user_id=user_id)
         except Exception as e:
             st.error(str(e))
-
-        st.session_state["just_added"] = True
-        maybe_play_submit_sound(company, role)
+        else:
+            st.session_state["just_added"] = True
+            maybe_play_submit_sound(company, role)
 
 
 def maybe_play_submit_sound(company: str, role: str):
@@ -81,97 +104,6 @@ def maybe_play_submit_sound(company: str, role: str):
         st.success(f"Added {company} - {role}")
         st.session_state["just_added"] = False
 
-def read_uploaded_csv(file):
-    """
-    Reads a specified csv file
-    """
-
-    tries = ["utf-8", "utf-8-sig", "cp1252", "latin1"]
-
-    for enc in tries:
-        try:
-            file.seek(0)
-            return pd.read_csv(file, encoding=enc, sep=None, engine="python")
-        
-        except UnicodeDecodeError:
-            continue
-
-    file.seek(0)
-    return pd.read_csv(file, encoding="latin1", sep=None, engine="python")
-
-def app_ly_user_mapping(df_raw: pd.DataFrame, user_choice: dict[str,str]):
-    """
-    Input:
-    - df_raw: raw dataframe representing csv uploaded by user
-    - user_choice: dictionary where keys are columns in the dataframe from the site and values are the user inputted columns
-    
-    Given this input, the function will map the user-selected columns to the columns of the raw dataframe
-
-    Output:
-    A dataframe where columns are specified by the user
-    """
-    aliases = {"submitted": "Applied",
-               "online assessment": "OA",
-                "assessment": "OA",
-                "phone screen": "Interview",
-                "onsite": "Interview",
-                "offer accepted": "Offer",
-                "declined": "Rejected"}
-    
-    allowed = {"Applied", "OA", "Interview", "Offer", "Rejected"}
-
-    picks = [user_choice['company'], user_choice['role'], user_choice['date_applied'], user_choice['status']]
-
-    if len(set(picks)) < 4:
-        st.write("Each target field must map to a different CSV column")
-    
-    missing = [c for c in picks if c not in df_raw.columns]
-    if missing:
-        raise KeyError(f"Selected column(s) not found in CSV: {missing}")
-    
-    out = pd.DataFrame({
-        "company": df_raw[user_choice['company']].astype(str).str.strip(),
-        "role": df_raw[user_choice["role"]].astype(str).str.strip(),
-        "date_applied": df_raw[user_choice['date_applied']],
-        "status": df_raw[user_choice["status"]].astype(str).str.strip()
-    })
-
-    s = out["status"].astype(str).str.strip().str.lower()
-    s = s.map(lambda v: aliases.get(v, v))
-    s = s.map(lambda v: "OA" if v == 'oa' else v.title())
-    out["status"] = s
-
-    unknown = out.loc[~out["status"].isin(allowed), "status"].unique().tolist()
-    if unknown:
-        st.write(f"unknown statusL {unknown}")
-
-
-    return out
-
-def prepare_rows_for_insert(valid_df):
-    ret_list = []
-    dates = pd.to_datetime(valid_df["date_applied"], errors='coerce').dt.date
-    for i, row in enumerate(valid_df.itertuples(index=False)):
-        date_iso = dates.iat[i].isoformat()
-        ret_list.append((row.company, row.role, date_iso, row.status))
-    
-    return ret_list
-
-def bulk_insert_applications(rows):
-    if rows is None or rows == []:
-        return 0
-    
-    sql = """
-        INSERT INTO applications (company, role, date_applied, status)
-        VALUES (?, ?, ?, ?)"""
-    
-    with get_connection() as conn:
-        conn.executemany(sql, rows)
-
-    inserted = len(rows)
-
-    return inserted
-
 with tab_apps:
     with st.expander("Add an application", expanded=True):
         render_add_application_form()
@@ -180,19 +112,20 @@ with tab_apps:
 def process_csv(csv):
     if csv is None:
         return
-    
-    csv.seek(0)
 
-    if 'import_df_raw' in st.session_state:
-        df_raw = st.session_state["import_df_raw"]
+    # sniff once per upload, the full file is only read when importing
+    if "import_sniff" not in st.session_state:
+        encoding, delimiter = sniff_csv(csv)
+        st.session_state["import_sniff"] = (encoding, delimiter)
+        st.session_state["import_preview"] = preview_csv(csv, encoding, delimiter)
+        st.session_state["import_date_formats"] = {}
 
-    else:
-        df_raw = read_uploaded_csv(csv)
-        st.session_state["import_df_raw"] = df_raw
+    encoding, delimiter = st.session_state["import_sniff"]
+    df_preview = st.session_state["import_preview"]
 
-    st.dataframe(df_raw[:10])
+    st.dataframe(df_preview)
 
-    columns = df_raw.columns
+    columns = df_preview.columns
     company = st.selectbox(label = "Select the column that matches 'Company'", options=columns)
     role = st.selectbox(label="Select the column that matches 'Role'", options=columns)
     date_applied = st.selectbox(label="Select the column that matches 'Date Applied'", options=columns)
@@ -202,10 +135,36 @@ def process_csv(csv):
                "role": role,
                "date_applied": date_applied,
                "status": status}
-    
-    valid_df = apply_user_mapping(df_raw, mapping)
-    rows = prepare_rows_for_insert(valid_df)
-    bulk_insert_applications(rows)
+
+    problems = check_mapping(mapping, columns)
+    for problem in problems:
+        st.warning(problem)
+
+    # one date format for the whole file, guessed from the chosen column (once per column)
+    date_format = "mixed"
+    if not problems:
+        guessed = st.session_state["import_date_formats"]
+        if date_applied not in guessed:
+            guessed[date_applied] = date_formats(csv, encoding, delimiter, date_applied)
+        date_format = st.selectbox("Date format", guessed[date_applied] + ["mixed"],
+                                   format_func=lambda fmt: "Guess each date on its own" if fmt == "mixed" else fmt)
+
+    existing = st.radio("Rows already in your list (same company, role and date)",
+                        ["Update their status", "Skip them"], horizontal=True)
+    on_conflict = "update" if existing == "Update their status" else "skip"
+
+    if not st.button("Import", disabled=bool(problems)):
+        return
+
+    bar = st.progress(0.0, text="Importing...")
+
+    def show_progress(rows_done, fraction, rows_per_sec):
+        bar.progress(fraction, text=f"{rows_done:,} rows imported ({rows_per_sec:,.0f} rows/s)")
+
+    report = import_csv(csv, mapping, encoding, delimiter, on_conflict=on_conflict, progress=show_progress,
+                        user_id=user_id, date_format=date_format)
+    st.session_state["import_report"] = report
+    st.session_state.pop("import_sniff", None)
     st.rerun()
 
 @st.dialog("Are you sure you want to delete all applications? This action is permanent")
@@ -217,7 +176,7 @@ def delete_all():
         no_button = st.button("No")
     
     if yes_button:
-        delete_all_apps()
+        delete_all_apps(user_id)
         st.rerun()
     elif no_button:
         st.rerun()
@@ -231,9 +190,18 @@ with st.sidebar:
         confirm_file = st.button("Confirm File")
     if file and confirm_file:
         st.session_state["csv"] = file
-        st.session_state.pop("import_df_raw", None)
+        st.session_state.pop("import_sniff", None)
         process_csv(file)
 
+    report = st.session_state.pop("import_report", None)
+    if report:
+        st.success(f"Imported {report['rows']:,} rows in {report['seconds']:.1f}s: "
+                   f"{report['inserted']:,} new, {report['updated']:,} updated, {report['skipped']:,} unchanged")
+        if report["invalid"]:
+            st.warning(f"Skipped {report['invalid']:,} rows with a missing field, bad date or unknown status")
+        if report["unknown"]:
+            st.write(f"Unknown statuses: {sorted(report['unknown'])}")
+
     company_filter = st.text_input("Company contains")
 
     role_filter = st.text_input("Role contains")
@@ -250,34 +218,62 @@ with st.sidebar:
     if status_filter == "All":
         status_filter = None
 
-    limit = st.number_input("Max rows", min_value=10, value=1000, step=100)
+    limit = st.number_input("Rows per page", min_value=10, value=100, step=100)
 
     delete_all_button = st.button(f":red[Delete all applications?]")
     if delete_all_button:
         delete_all()
 
+def render_page_controls(page_cursors, next_cursor):
+    """
+    Previous/Next buttons for the applications table. The callbacks edit the cursor stack
+    before the rerun, so the new page is queried straight away.
+    """
+    def go_next():
+        page_cursors.append(next_cursor)
+
+    def go_prev():
+        page_cursors.pop()
+
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        st.button("Previous", on_click=go_prev, disabled=len(page_cursors) == 1)
+    with col_page:
+        st.caption(f"Page {len(page_cursors)}")
+    with col_next:
+        st.button("Next", on_click=go_next, disabled=next_cursor is None)
+
 with tab_apps:
     # Data table:
     if not date_filter:
         start_date = None
         end_date = None
 
-    if limit:
-        rows = list_applications_df(limit=limit, status=status_filter, date_start=start_date, date_end=end_date, company_substr=company_filter)
-
+    # Keyset paging: page_cursors holds the cursor of every page visited so far,
+    # the last one is the page being shown. Changing any filter starts over at page 1.
+    view_filters = dict(status=status_filter, date_start=start_date, date_end=end_date,
+                        company_substr=company_filter, role_substr=role_filter)
+    view_key = (user_id, tuple(view_filters.items()), limit)
+    if st.session_state.get("page_view_key") != view_key:
+        st.session_state["page_view_key"] = view_key
+        st.session_state["page_cursors"] = [None]
+
+    page_cursors = st.session_state["page_cursors"]
+    with span("page: load rows"):
+        rows, next_cursor = list_applications_page(page_size=limit, after=page_cursors[-1], user_id=user_id,
+                                                   **view_filters)
+    df_edit = None
+    if rows.empty:
+        st.write("Add your first job!")
     else:
-        rows = list_applications_df(limit=None, status=status_filter, date_start=start_date, date_end=end_date, company_substr=company_filter)
-    try:
-
-        rows["date_applied"] = pd.to_datetime(rows["date_applied"], errors="coerce").dt.strftime("%m/%d/%Y")
-        rows = rows.sort_values(["date_applied", "id"], ascending=[False, False], kind="mergesort")
         rows = rows.reindex(columns=['id', 'company', "role", "date_applied", "status"])
         rows["delete"] = False
 
-
-        rows["delete"] = False
-        if "apps_orig" not in st.session_state:
+        # snapshot of the page as loaded, apply_changes diffs the editor against it
+        page_key = (view_key, page_cursors[-1])
+        if "apps_orig" not in st.session_state or st.session_state.get("apps_orig_key") != page_key:
             st.session_state["apps_orig"] = rows.copy(deep=True)
+            st.session_state["apps_orig_key"] = page_key
 
         st.subheader("Recent applications")
 
@@ -297,29 +293,28 @@ with tab_apps:
                         "id": None,
                         "company": "Company",
                         "role": "Role",
-                        "date_applied": "Date Applied",
+                        "date_applied": st.column_config.DateColumn("Date Applied", format="MM/DD/YYYY"),
                         "delete": st.column_config.CheckboxColumn(
                             "Delete?",
                         )
                     },
                     disabled=["id", "company", "role", "date_applied"])
-        
-        export_df = df_edit.drop(columns=["delete"], errors="ignore")
 
-
-        st.download_button(
-            label="Download current view (CSV)",
-            data=export_df.to_csv(index=False).encode("utf-8"),
-            file_name="applications_current.csv",
-            mime="text/csv",
-            disabled=export_df.empty,
-        )
+        render_page_controls(page_cursors, next_cursor)
         
-        init_id_counter_if_missing(df_edit)
+        # the export covers every page of the current filters and is only built when a button is
+        # clicked, straight from the database (edits not yet saved aren't in it)
+        formats = available_formats()
+        for col, fmt in zip(st.columns(len(formats)), formats):
+            mime, file_name = FORMATS[fmt]
+            col.download_button(
+                label=f"Download filtered view ({fmt.upper()})",
+                data=lambda fmt=fmt: export_bytes(fmt, user_id=user_id, **view_filters),
+                file_name=file_name,
+                mime=mime,
+                on_click="ignore",
+            )
 
-    except KeyError:
-        st.write("Add your first job!")
-        
 
 
 
@@ -328,13 +323,13 @@ with tab_apps:
     def apply_changes(df_edit):
 
         if df_edit is None or df_edit.empty or "id" not in df_edit.columns:
-            return
+            return True
         if "apps_orig" not in st.session_state:
-            return
+            return True
 
         orig = st.session_state["apps_orig"]
         if orig is None or orig.empty or "id" not in orig.columns:
-            return
+            return True
 
         orig_idx = orig.set_index("id")
         edit_idx = df_edit.set_index("id")
@@ -345,144 +340,148 @@ with tab_apps:
 
         changed_mask = orig_status.ne(edit_status)
         changed_ids = list(common_ids[changed_mask])
+        updates = [(app_id, edit_idx.at[app_id, "status"]) for app_id in changed_ids]
 
-        for app_id in changed_ids:
-            new_status = edit_idx.at[app_id, "status"]
-            update_status(app_id, new_status)
-
-        delete_mask = edit_idx.loc[common_ids, "delete"] == True
         delete_ids = edit_idx.index[edit_idx["delete"].fillna(False).astype(bool)].tolist()
 
-        for app_id in delete_ids:
-            try:
-                delete_application(app_id)
-            except Exception as e:
-                st.error(f"Error applying changes: {e}")
+        try:
+            results = apply_batch(updates, delete_ids, user_id=user_id)
+        except Exception as e:
+            st.error(f"Error applying changes: {e}")
+            return False
 
-        return
+        failed = {app_id: r for app_id, r in results.items() if r not in ("updated", "deleted")}
+        if failed:
+            st.warning(f"Some rows were not changed: {failed}")
+            return False
+
+        return True
 
 with tab_apps:
     if st.button("Apply changes"):
-        apply_changes(df_edit)
+        applied = apply_changes(df_edit)
         st.session_state.pop("apps_orig", None)
-        st.rerun()
-
+        if applied:
+            st.rerun()
 
 
 
-with tab_analytics:
-    st.header("Analytics")
-
-    col1, col2, col3, col4 = st.columns(4)
-
-    with col1:
-        sql = """
-            SELECT COUNT(*)
-            FROM applications"""
-        
-        with get_connection() as conn:
-            count = conn.execute(sql).fetchone()
-            st.subheader(f"Total apps: :blue[{count[0]}]")
-
-    with col2:
-        st.subheader(f"Past 7 days: :blue[{count_apps_this_week()}]")
 
-    with col3:
-        applied = get_status_count("Applied")
-        st.subheader(f"Applied: :green[{applied}]")
+if tab_analytics.open:
+    with tab_analytics:
+        from analytics import summary, weekly_applications, top_companies, calendar_heatmap, top_role_terms
+        import altair as alt
+        import plotly.express as px
 
-    with col4:
-        rejected = get_status_count("Rejected")
-        st.subheader(f"Rejected: :red[{rejected}]")
+        st.header("Analytics")
 
+        # calendar heatmap span -> days; the selectbox sits under the chart, so read its value first
+        CALENDAR_RANGES = {"6 months": 175, "1 year": 364, "2 years": 728, "5 years": 1820}
+        calendar_range = st.session_state.get("calendar_range", "6 months")
 
-    #st.dataframe(weekly_applications(df_edit))
-
-    
-    col1, col2 = st.columns(2)
-
-    # Weekly chart
-    try:
-        weekly_apps = weekly_applications(df_edit)
+        col1, col2, col3, col4 = st.columns(4)
+        header = summary(user_id)
 
         with col1:
-            with st.container(border=True):
-                st.subheader("Weekly volume")
-                st.line_chart(data=weekly_apps, x="week_start")
-
-
-            with st.container(border=True):
-                st.subheader("Top roles applied to")
-                all_rows = list_applications_df(limit=10000)
-                top_terms = top_role_terms(all_rows, n=25, ngram_range=(2, 3))
-
-                plot = st.altair_chart(
-                alt.Chart(top_terms).mark_bar().encode(
-                    x=alt.X('term:N', sort=top_terms['term'].tolist()),
-                    y='count:Q'
-                ),
-                use_container_width=True
-            )
-
-        # Heatmap
-        n_days = 175
-        today = pd.Timestamp.today().normalize()
-        start = today - pd.Timedelta(days=n_days - 1)
-
-        all_rows = list_applications_df(
-            limit=10000,
-            date_start=start.date(),
-            date_end=today.date()
-        )
-
-        cal_counts = calendar_counts(all_rows, n_days)
-
-        mat = cal_counts.pivot(index="dow", columns="week_idx", values="n").fillna(0)
-
-        fig = px.imshow(mat, origin="upper", aspect="equal", labels=dict(color="Apps/day"), color_continuous_scale='speed')
-        fig.update_yaxes(tickmode="array", tickvals=[0, 1, 2, 3, 4, 5, 6],
-                        ticktext=["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"])
-
-
-        date_mat = cal_counts.pivot(index="dow", columns="week_idx", values="date")
-        date_mat = date_mat.astype(str)
-
-        fig.update_traces(
-            customdata=date_mat.values,
-            hovertemplate="%{customdata}<br>Apps: %{z}<extra></extra>",
-            showlegend=False
-        )
-
-        tickvals, ticktext = calendar_month_ticks(cal_counts)
-        fig.update_xaxes(tickmode="array", tickvals=tickvals, ticktext=ticktext)
-        fig.layout.coloraxis.showscale = False
+            st.subheader(f"Total apps: :blue[{header['total']}]")
 
         with col2:
-            with st.container(border=True):
-                st.subheader("Calendar")
-                st.plotly_chart(fig)
+            st.subheader(f"Past 7 days: :blue[{header['past_7_days']}]")
 
-            
-            with st.container(border=True):
-                st.subheader("Top companies applied to")
-                top_comp = top_companies(df_edit, 15)
-                top_comp = top_comp.sort_values(by="Apps", ascending=False)
-
-                plot = st.altair_chart(
-                    alt.Chart(top_comp).mark_bar().encode(
-                    x=alt.X('Company:N', sort=top_comp['Apps'].tolist()),
-                    y='Apps:Q'
-                ),
-                use_container_width=True
-            )
+        with col3:
+            st.subheader(f"Applied: :green[{header['Applied']}]")
 
-    except NameError or KeyError:
-        st.write("Add a job to view analytics")
+        with col4:
+            st.subheader(f"Rejected: :red[{header['Rejected']}]")
 
 
+        #st.dataframe(weekly_applications(df_edit))
 
+    
+        col1, col2 = st.columns(2)
+
+        # Weekly chart
+        if header["total"] == 0:
+            st.write("Add a job to view analytics")
+        else:
+            # charts load (and cache) their own rows, the editor only holds one page
+            with col1:
+                with st.container(border=True), span("chart: weekly volume"):
+                    weekly_apps = weekly_applications(user_id=user_id)
+                    st.subheader("Weekly volume")
+                    st.line_chart(data=weekly_apps, x="week_start")
+
+
+                with st.container(border=True), span("chart: top roles"):
+                    st.subheader("Top roles applied to")
+                    top_terms = top_role_terms(n=10, ngram_range=(2, 3), user_id=user_id)
+
+                    plot = st.altair_chart(
+                    alt.Chart(top_terms).mark_bar().encode(
+                        x=alt.X('term:N', sort=top_terms['term'].tolist()),
+                        y='count:Q'
+                    ),
+                    use_container_width=True
+                )
+
+            # Heatmap
+            with span("chart: calendar"):
+                cal = calendar_heatmap(n_days=CALENDAR_RANGES[calendar_range], user_id=user_id)
+                n_weeks = cal["counts"].shape[1]
+
+                fig = px.imshow(cal["counts"], origin="upper", aspect="equal" if n_weeks <= 60 else "auto",
+                                labels=dict(color="Apps/day"), color_continuous_scale='speed')
+                fig.update_yaxes(tickmode="array", tickvals=[0, 1, 2, 3, 4, 5, 6],
+                                ticktext=["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"])
+
+                fig.update_traces(
+                    customdata=cal["labels"],
+                    hovertemplate="%{customdata}<br>Apps: %{z}<extra></extra>",
+                    showlegend=False
+                )
+
+                fig.update_xaxes(tickmode="array", tickvals=cal["tickvals"], ticktext=cal["ticktext"])
+                fig.layout.coloraxis.showscale = False
+
+            with col2:
+                with st.container(border=True):
+                    st.subheader("Calendar")
+                    st.plotly_chart(fig)
+                    st.selectbox("Range", list(CALENDAR_RANGES), key="calendar_range")
 
+            
+                with st.container(border=True), span("chart: top companies"):
+                    st.subheader("Top companies applied to")
+                    top_comp = top_companies(k=15, user_id=user_id)
+
+                    plot = st.altair_chart(
+                        alt.Chart(top_comp).mark_bar().encode(
+                        x=alt.X('Company:N', sort='-y'),
+                        y='Apps:Q'
+                    ),
+                    use_container_width=True
+                )
+
+
+def render_profile_panel(since):
+    """Sidebar table of this rerun's timings, slowest first, with the plans of slow statements"""
+    recs = profiling.records(since=since, this_thread=True)
+    summary_rows = profiling.summarize(recs)
+
+    with st.sidebar.expander("Profiling (this rerun)", expanded=True):
+        st.caption(f"{len(recs)} records, slow query threshold {profiling.SLOW_QUERY_MS:.0f} ms")
+        if not summary_rows:
+            st.write("Nothing recorded")
+            return
+        st.dataframe(
+            pd.DataFrame(summary_rows)[["kind", "name", "calls", "total_ms", "max_ms", "rows"]],
+            hide_index=True,
+        )
+        for row in summary_rows:
+            if row["kind"] == "sql" and row["plan"]:
+                st.markdown(f"**{row['max_ms']:.0f} ms** `{row['name'][:120]}`")
+                st.code("\n".join(row["plan"]), language=None)
 
-    
-    
 
+if debug:
+    render_profile_panel(profile_since)